@@ -1,11 +1,21 @@
+import atexit
 import os
+import threading
+from datetime import datetime, timedelta
 
+import serialization
 from chatbot import Chatbot
 from db.database import Database
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, send_from_directory
+from export_transcripts import EXPORT_FORMATS, export_transcripts
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from mysql.connector import Error
+from retention import ChatArchiver
+from search import search_messages
+from slots import SlotGenerator
+from usage import UsageLedger
 
 # Load environment variables
 load_dotenv()
@@ -13,19 +23,40 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__, static_folder="static", static_url_path="")
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
+app.json = serialization.OrjsonProvider(app)
 CORS(app)
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Initialize SocketIO with the same JSON encoder as the REST API
+socketio = SocketIO(app, cors_allowed_origins="*", json=serialization)
 
 # Initialize database and chatbot
 db = Database()
 db.connect()
-chatbot = Chatbot(db=db)
+usage_ledger = UsageLedger(db=db)
+chatbot = Chatbot(db=db, usage_ledger=usage_ledger)
+chat_archiver = ChatArchiver(db=db)
+slot_generator = SlotGenerator(db=db)
+
+# Seconds between background flushes of buffered usage records
+USAGE_FLUSH_INTERVAL = int(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+
+# Seconds between background archival runs of old and soft-deleted chats
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Seconds between background runs of the booking slot generator
+SLOT_GENERATION_INTERVAL = int(os.getenv("SLOT_GENERATION_INTERVAL", "3600"))
+
+# Seconds between background removals of chats that never received a message
+EMPTY_CHAT_CLEANUP_INTERVAL = int(os.getenv("EMPTY_CHAT_CLEANUP_INTERVAL", "3600"))
 
 # Track connected admin users per chat room
 admin_connections = {}  # {chat_id: [sid1, sid2, ...]}
 
+# Chats created for provisional student sessions, so a session only ever creates one chat
+provisional_sessions = {}  # {session_id: (sid, chat_id)}
+provisional_sessions_lock = threading.Lock()
+provisional_session_locks = {}  # {session_id: Lock} serializing the chat creation of each session
+
 
 # ============================================================================
 # REST API Endpoints
@@ -59,11 +90,6 @@ def get_all_chats():
     """Get all chats"""
     try:
         chats = db.get_all_chats()
-
-        # Convert datetime objects to strings
-        for chat in chats:
-            chat["created_at"] = chat["created_at"].isoformat() if chat["created_at"] else None
-
         return jsonify({"success": True, "chats": chats}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -78,13 +104,88 @@ def get_chat_by_id(chat_id):
             return jsonify({"success": False, "error": "Chat not found"}), 404
 
         history = db.get_chat_history(chat_id)
+        usage = db.get_chat_usage(chat_id)
+
+        return jsonify({"success": True, "chat": chat, "history": history, "usage": usage}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        # Convert datetime objects to strings
-        chat["created_at"] = chat["created_at"].isoformat() if chat["created_at"] else None
-        for msg in history:
-            msg["created_at"] = msg["created_at"].isoformat() if msg["created_at"] else None
 
-        return jsonify({"success": True, "chat": chat, "history": history}), 200
+@app.route("/api/search", methods=["GET"])
+def search_chat_messages():
+    """Full-text search across chat messages (admin)"""
+    search_query = request.args.get("q", "").strip()
+    if not search_query:
+        return jsonify({"success": False, "error": "Search query (q) is required"}), 400
+
+    role = request.args.get("role")
+    if role is not None and role not in ["ai", "human", "human_operator"]:
+        return jsonify({"success": False, "error": "Invalid role"}), 400
+
+    human_enabled = request.args.get("human_enabled")
+    is_human_enabled = human_enabled.lower() in ["1", "true"] if human_enabled is not None else None
+    limit = min(max(request.args.get("limit", default=20, type=int), 1), 100)
+
+    try:
+        start = datetime.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        page = search_messages(
+            db,
+            search_query,
+            role=role,
+            start=start,
+            end=end,
+            is_human_enabled=is_human_enabled,
+            cursor=request.args.get("cursor"),
+            limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    return jsonify({"success": True, **page}), 200
+
+
+@app.route("/api/export/transcripts", methods=["GET"])
+def export_chat_transcripts():
+    """Stream all transcripts as NDJSON or CSV (query: format, start, end, since_id)"""
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": 'Invalid format. Use "ndjson" or "csv".'}), 400
+
+    try:
+        start = datetime.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        since_id = int(request.args["since_id"]) if request.args.get("since_id") else None
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {e}"}), 400
+
+    chunks = export_transcripts(db, export_format, start=start, end=end, since_id=since_id)
+    filename = f"transcripts-{datetime.now().strftime('%Y%m%d%H%M%S')}.{export_format}"
+
+    # No Content-Length is set, so the response is sent with chunked transfer encoding
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@app.route("/api/usage", methods=["GET"])
+def get_usage_summary():
+    """Get aggregate token usage per provider and model, budget status and booking prefetch stats (admin)"""
+    try:
+        days = request.args.get("days", default=1, type=int)
+        since = datetime.now() - timedelta(days=days)
+        summary = db.get_usage_summary(since)
+
+        budget = usage_ledger.get_budget_status()
+        prefetch = chatbot.get_prefetch_stats()
+
+        return jsonify(
+            {"success": True, "days": days, "summary": summary, "budget": budget, "prefetch": prefetch}
+        ), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -111,8 +212,21 @@ def handle_model():
 
 @socketio.on("student_connect")
 def handle_student_connect(data):
-    """Handle student connection to a chat"""
+    """
+    Handle student connection to a chat.
+    A new conversation connects with a client-generated `session_id` and no chat is created
+    until its first message. Clients that send neither get a chat created right away.
+    """
     chat_id = data.get("chat_id")
+    session_id = data.get("session_id")
+
+    if not chat_id and session_id:
+        emit(
+            "student_connected",
+            {"chat_id": None, "session_id": session_id, "chat": None, "history": [], "is_admin_connected": False},
+        )
+        print(f"Student connected with provisional session {session_id}")
+        return
 
     if not chat_id:
         # Create a new chat
@@ -130,14 +244,6 @@ def handle_student_connect(data):
     chat = db.get_chat_by_id(chat_id)
     history = db.get_chat_history(chat_id)
 
-    # Convert datetime objects in chat
-    if chat:
-        chat["created_at"] = chat["created_at"].isoformat() if chat["created_at"] else None
-
-    # Convert datetime objects in history
-    for msg in history:
-        msg["created_at"] = msg["created_at"].isoformat() if msg["created_at"] else None
-
     # Check if admin is connected
     is_admin_connected = f"chat_{chat_id}" in admin_connections and len(admin_connections[f"chat_{chat_id}"]) > 0
 
@@ -155,24 +261,65 @@ def handle_student_disconnect():
     print("Student disconnected")
 
 
+def get_or_create_session_chat(session_id: str):
+    """Create the chat for a provisional session on its first message, returns the chat ID"""
+    with provisional_sessions_lock:
+        if session_id in provisional_sessions:
+            return provisional_sessions[session_id][1]
+        session_lock = provisional_session_locks.setdefault(session_id, threading.Lock())
+
+    # Only messages of the same session wait for the insert, other sessions keep going
+    with session_lock:
+        with provisional_sessions_lock:
+            if session_id in provisional_sessions:
+                return provisional_sessions[session_id][1]
+
+        chat_id = db.create_chat()
+        if not chat_id:
+            return None
+        with provisional_sessions_lock:
+            provisional_sessions[session_id] = (request.sid, chat_id)
+            provisional_session_locks.pop(session_id, None)
+
+    join_room(f"chat_{chat_id}")
+    emit("chat_created", {"chat_id": chat_id, "session_id": session_id})
+    print(f"Created chat {chat_id} for session {session_id}")
+    return chat_id
+
+
 @socketio.on("student_message")
 def handle_student_message(data):
-    """Handle message from student"""
+    """Handle message from student, creating the chat on the first message of a provisional session"""
     chat_id = data.get("chat_id")
+    session_id = data.get("session_id")
     message = data.get("message")
 
-    if not chat_id or not message:
+    if not (chat_id or session_id) or not message:
         emit("error", {"message": "Invalid message data"})
         return
 
-    # Check if chat exists
-    chat = db.get_chat_by_id(chat_id)
-    if not chat:
-        emit("error", {"message": "Chat not found"})
-        return
+    if not chat_id:
+        chat_id = get_or_create_session_chat(session_id)
+        if not chat_id:
+            emit("error", {"message": "Failed to create chat"})
+            return
 
-    # Save student message
-    db.add_message(chat_id, "human", message)
+    # Load the chat with its recent history and save the student message on one connection
+    try:
+        with db.session() as session:
+            chat, history = session.get_chat_with_history(chat_id, chatbot.history_window)
+            if not chat:
+                emit("error", {"message": "Chat not found"})
+                return
+            session.add_message(chat_id, "human", message)
+            saved = session.commit()
+    except Error as e:
+        print(f"Error opening database session for chat {chat_id}: {e}")
+        saved = False
+
+    if not saved:
+        emit("error", {"message": "Failed to save message, please try again"})
+        return
 
     # Broadcast message to all users in the chat room (including admin)
     socketio.emit("new_message", {"chat_id": chat_id, "role": "human", "message": message}, room=f"chat_{chat_id}")
@@ -182,27 +329,38 @@ def handle_student_message(data):
         print(f"Human enabled for chat {chat_id}, skipping AI response")
         return
 
-    # Generate AI response with tool calling support
-    history = db.get_chat_history(chat_id)
+    # Generate AI response with tool calling support, no connection is held during the model call
+    history.append({"chat_id": chat_id, "role": "human", "message": message})
     result = chatbot.generate_response(message, history, chat_id=chat_id)
 
     ai_response = result["response"]
     needs_escalation = result.get("needs_escalation", False)
     booking_id = result.get("booking_id")
 
-    # Save AI response
-    db.add_message(chat_id, "ai", ai_response)
+    # Save AI response and escalation in one commit
+    try:
+        with db.session() as session:
+            session.add_message(chat_id, "ai", ai_response)
+            if needs_escalation:
+                session.update_chat_human_enabled(chat_id, True)
+            saved = session.commit()
+    except Error as e:
+        print(f"Error opening database session for chat {chat_id}: {e}")
+        saved = False
+
+    # The booking is stored by the tool call, confirm it even if the reply could not be saved
+    if booking_id:
+        socketio.emit("booking_confirmed", {"chat_id": chat_id, "booking_id": booking_id}, room=f"chat_{chat_id}")
+
+    if not saved:
+        emit("error", {"message": "Failed to save the assistant's reply, please try again"})
+        return
 
     # Broadcast AI response
     socketio.emit("new_message", {"chat_id": chat_id, "role": "ai", "message": ai_response}, room=f"chat_{chat_id}")
 
-    # Handle booking confirmation if a slot was booked
-    if booking_id:
-        socketio.emit("booking_confirmed", {"chat_id": chat_id, "booking_id": booking_id}, room=f"chat_{chat_id}")
-
     # Handle escalation if needed
     if needs_escalation:
-        db.update_chat_human_enabled(chat_id, True)
         socketio.emit("escalation_triggered", {"chat_id": chat_id, "is_human_enabled": True}, room=f"chat_{chat_id}")
 
 
@@ -233,14 +391,6 @@ def handle_admin_connect(data):
     chat = db.get_chat_by_id(chat_id)
     history = db.get_chat_history(chat_id)
 
-    # Convert datetime objects in chat
-    if chat:
-        chat["created_at"] = chat["created_at"].isoformat() if chat["created_at"] else None
-
-    # Convert datetime objects in history
-    for msg in history:
-        msg["created_at"] = msg["created_at"].isoformat() if msg["created_at"] else None
-
     emit("admin_connected", {"chat_id": chat_id, "chat": chat, "history": history})
 
     # Notify student that admin is connected
@@ -280,6 +430,12 @@ def handle_disconnect():
                 chat_id = room.replace("chat_", "")
                 socketio.emit("admin_status_changed", {"chat_id": int(chat_id), "is_admin_connected": False}, room=room)
 
+    # Forget the provisional sessions of this client, it uses the chat ID from now on
+    with provisional_sessions_lock:
+        for session_id, (sid, _) in list(provisional_sessions.items()):
+            if sid == request.sid:
+                del provisional_sessions[session_id]
+
     print("Client disconnected")
 
 
@@ -334,10 +490,64 @@ def handle_toggle_human_enabled(data):
         emit("error", {"message": "Failed to update chat"})
 
 
+# ============================================================================
+# Background Tasks
+# ============================================================================
+
+
+def flush_usage_periodically():
+    """Write buffered token usage records to the database at a fixed interval"""
+    while True:
+        socketio.sleep(USAGE_FLUSH_INTERVAL)
+        usage_ledger.flush()
+
+
+def archive_chats_periodically():
+    """Move old and soft-deleted chats into archive files at a fixed interval"""
+    while True:
+        socketio.sleep(ARCHIVE_INTERVAL)
+        try:
+            chat_archiver.archive()
+        except Exception as e:
+            print(f"Error archiving chats: {e}")
+
+
+def remove_empty_chats_periodically():
+    """Delete chats that never received a message at a fixed interval"""
+    while True:
+        socketio.sleep(EMPTY_CHAT_CLEANUP_INTERVAL)
+        try:
+            chat_archiver.remove_empty_chats()
+        except Exception as e:
+            print(f"Error removing empty chats: {e}")
+
+
+def generate_slots_periodically():
+    """Keep the rolling window of booking slots filled, starting immediately"""
+    while True:
+        try:
+            slot_generator.run()
+        except Exception as e:
+            print(f"Error generating booking slots: {e}")
+        socketio.sleep(SLOT_GENERATION_INTERVAL)
+
+
 # ============================================================================
 # Run the application
 # ============================================================================
 
 if __name__ == "__main__":
+    debug = True
+
+    # In debug mode the reloader runs this module in a watcher process and in the serving child
+    # process (WERKZEUG_RUN_MAIN=true), background jobs only run in the serving process
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        socketio.start_background_task(flush_usage_periodically)
+        socketio.start_background_task(generate_slots_periodically)
+        socketio.start_background_task(remove_empty_chats_periodically)
+        if chat_archiver.retention_days > 0:
+            socketio.start_background_task(archive_chats_periodically)
+        atexit.register(usage_ledger.flush)
+
     port = int(os.getenv("PORT", 3000))
-    socketio.run(app, host="0.0.0.0", port=port, debug=True)
+    socketio.run(app, host="0.0.0.0", port=port, debug=debug)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Booking concurrency stress test for Havana University Chat Bot
+Runs many concurrent bookers against a small set of slots and checks that no slot is booked twice
+
+Usage:
+    python booking_stress.py [--bookers 500] [--slots 20] [--concurrency 32]
+
+The test creates its own chats and slots on a date far in the future and removes them afterwards.
+Exits with status 1 if a double booking is detected.
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from db.database import Database
+from dotenv import load_dotenv
+
+STRESS_ADVISOR = "stress-test"
+
+
+def run_stress_test(db, bookers: int, slot_count: int, concurrency: int) -> bool:
+    """Run the stress test, returns True if there were no double bookings"""
+    slot_date = date.today() + timedelta(days=3650)
+    slot_times = [f"{index // 60:02d}{index % 60:02d}" for index in range(slot_count)]
+
+    db.add_booking_slots([(slot_date, slot_time, STRESS_ADVISOR) for slot_time in slot_times])
+    chat_ids = [db.create_chat() for _ in range(bookers)]
+
+    # Every booker targets one of the slots, so each slot is contested by bookers / slot_count bookers
+    barrier = threading.Barrier(min(concurrency, bookers))
+
+    def book(index: int):
+        if index < barrier.parties:
+            barrier.wait()
+        start = time.perf_counter()
+        booking_id = db.book_slot_at(slot_date.isoformat(), slot_times[index % slot_count], chat_ids[index])
+        return chat_ids[index], booking_id, time.perf_counter() - start
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(book, range(bookers)))
+        elapsed = time.perf_counter() - started
+
+        successes = [(chat_id, booking_id) for chat_id, booking_id, _ in results if booking_id]
+        latencies = sorted(latency for _, _, latency in results)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        booked_rows = db.fetch_all(
+            "SELECT id, chat_id FROM bookings WHERE date = %s AND advisor = %s AND chat_id IS NOT NULL",
+            (slot_date, STRESS_ADVISOR),
+            use_primary=True,
+        )
+        booked_by_id = {row["id"]: row["chat_id"] for row in booked_rows}
+
+        # A double booking shows up as two bookers receiving the same slot ID,
+        # or a booker whose slot ended up belonging to another chat
+        booking_ids = [booking_id for _, booking_id in successes]
+        double_bookings = len(booking_ids) - len(set(booking_ids))
+        mismatches = sum(1 for chat_id, booking_id in successes if booked_by_id.get(booking_id) != chat_id)
+
+        print(f"Bookers:          {bookers} ({concurrency} concurrent)")
+        print(f"Slots:            {slot_count}")
+        print(f"Successful:       {len(successes)}")
+        print(f"Rejected:         {bookers - len(successes)}")
+        print(f"Double bookings:  {double_bookings}")
+        print(f"Mismatched rows:  {mismatches}")
+        print(f"Elapsed:          {elapsed:.3f}s")
+        print(f"Throughput:       {bookers / elapsed:.1f} booking attempts/s")
+        print(f"Latency p50:      {p50 * 1000:.1f}ms")
+        print(f"Latency p99:      {p99 * 1000:.1f}ms")
+
+        return (
+            double_bookings == 0
+            and mismatches == 0
+            and len(successes) == min(slot_count, bookers)
+            and len(booked_rows) == len(successes)
+        )
+    finally:
+        db.execute_query("DELETE FROM bookings WHERE date = %s AND advisor = %s", (slot_date, STRESS_ADVISOR))
+        placeholders = ", ".join(["%s"] * len(chat_ids))
+        db.execute_query(f"DELETE FROM chats WHERE id IN ({placeholders})", tuple(chat_ids))
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Stress test concurrent slot booking")
+    parser.add_argument("--bookers", type=int, default=500, help="Number of booking attempts")
+    parser.add_argument("--slots", type=int, default=20, help="Number of slots to compete for")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent bookers (max 32, the pool limit)")
+    args = parser.parse_args()
+
+    os.environ["DB_POOL_SIZE"] = str(min(args.concurrency, 32))
+    db = Database()
+    if not db.connect():
+        raise SystemExit(1)
+
+    if not run_stress_test(db, args.bookers, args.slots, min(args.concurrency, 32)):
+        print("✗ Booking consistency check failed")
+        raise SystemExit(1)
+    print("✓ No double bookings")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,115 @@
+import hashlib
 import os
+import re
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import serialization
+from intent import format_slots_by_date, has_booking_intent, mentions_slots
+from usage import UsageLedger
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai import ChatOpenAI
 
+SCHOOL_DATA_PATH = "school_data.txt"
+
 
 class Chatbot:
-    def __init__(self, db=None):
+    def __init__(self, db=None, usage_ledger=None):
         self.current_model = "openai"  # Default to OpenAI
-        self.school_data = self._load_school_data()
+        # The system prompt is built once per knowledge base version, see _refresh_knowledge_base()
+        self._knowledge_base_lock = threading.Lock()
+        self._knowledge_base_stat = None
+        self.knowledge_base_version = None
+        self.school_data = ""
+        self.system_message = None
+        self._refresh_knowledge_base()
+        # Models bound to the tools, reused so the request prefix stays byte-identical between calls
+        self._bound_models: Dict[str, Tuple[Any, str, Any]] = {}  # {model_key: (model, kb version, bound model)}
         self.openai_model = None
         self.gemini_model = None
+        # Cheaper models used once the daily token budget is exhausted
+        self.openai_economy_model = None
+        self.gemini_economy_model = None
+        self.model_names = {
+            "openai": "gpt-4o",
+            "gemini": "gemini-2.5-pro",
+            "openai_economy": os.getenv("OPENAI_ECONOMY_MODEL", "gpt-4o-mini"),
+            "gemini_economy": os.getenv("GEMINI_ECONOMY_MODEL", "gemini-2.5-flash"),
+        }
         self.db = db  # Database reference for tool access
+        self.usage_ledger = usage_ledger  # Token usage accounting and budgets
+        self.history_window = int(os.getenv("CHAT_HISTORY_WINDOW", "10"))  # History messages sent to the model
+        # Booking intent prefetch counters, see get_prefetch_stats()
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_stats = {
+            "turns": 0,
+            "prefetched": 0,
+            "hits": 0,
+            "misses": 0,
+            "false_positives": 0,
+            "hit_latency_ms": 0,
+            "slow_path_turns": 0,
+            "slow_path_latency_ms": 0,
+        }
         self._initialize_models()
         self._setup_tools()
 
     def _load_school_data(self) -> str:
         """Load school information from text file"""
         try:
-            with open("school_data.txt", "r") as f:
+            with open(SCHOOL_DATA_PATH, "r") as f:
                 return f.read()
         except FileNotFoundError:
-            print("Warning: school_data.txt not found")
+            print(f"Warning: {SCHOOL_DATA_PATH} not found")
             return ""
 
+    def _refresh_knowledge_base(self):
+        """Reload the school data and rebuild the system prompt if school_data.txt changed since the last build"""
+        try:
+            stat = os.stat(SCHOOL_DATA_PATH)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_stat = None
+
+        with self._knowledge_base_lock:
+            if self.system_message is not None and file_stat == self._knowledge_base_stat:
+                return
+            self._knowledge_base_stat = file_stat
+            self.school_data = self._load_school_data()
+            self.system_message = SystemMessage(content=self._get_system_prompt())
+            self.knowledge_base_version = hashlib.sha256(self.system_message.content.encode("utf-8")).hexdigest()[:12]
+            print(f"Built system prompt for knowledge base version {self.knowledge_base_version}")
+
+    def _get_bound_model(self, model_key: str, model):
+        """
+        Get the model bound to the tools, binding it once per model and knowledge base version.
+        OpenAI requests also carry a prompt_cache_key so calls sharing the prefix are routed to the same cache.
+        """
+        cached = self._bound_models.get(model_key)
+        if cached and cached[0] is model and cached[1] == self.knowledge_base_version:
+            return cached[2]
+
+        if model_key.startswith("openai"):
+            bound = model.bind_tools(self.tools, prompt_cache_key=f"havana-{self.knowledge_base_version}")
+        else:
+            bound = model.bind_tools(self.tools)
+        self._bound_models[model_key] = (model, self.knowledge_base_version, bound)
+        return bound
+
     def _initialize_models(self):
         """Initialize both LLM models"""
         try:
             openai_key = os.getenv("OPENAI_API_KEY")
             if openai_key:
-                self.openai_model = ChatOpenAI(model="gpt-4o", api_key=openai_key, temperature=0)
+                self.openai_model = ChatOpenAI(model=self.model_names["openai"], api_key=openai_key, temperature=0)
+                self.openai_economy_model = ChatOpenAI(
+                    model=self.model_names["openai_economy"], api_key=openai_key, temperature=0
+                )
         except Exception as e:
             print(f"Error initializing OpenAI model: {e}")
 
@@ -41,7 +117,10 @@ class Chatbot:
             google_key = os.getenv("GOOGLE_API_KEY")
             if google_key:
                 self.gemini_model = ChatGoogleGenerativeAI(
-                    model="gemini-2.5-pro", google_api_key=google_key, temperature=0
+                    model=self.model_names["gemini"], google_api_key=google_key, temperature=0
+                )
+                self.gemini_economy_model = ChatGoogleGenerativeAI(
+                    model=self.model_names["gemini_economy"], google_api_key=google_key, temperature=0
                 )
         except Exception as e:
             print(f"Error initializing Gemini model: {e}")
@@ -92,27 +171,16 @@ class Chatbot:
             - The conversation naturally leads to booking a follow-up call
 
             Returns:
-                JSON string with available slots including id, date, and time
+                JSON string with available slots including id, date, time (HHMM) and display_time (HH:MM)
             """
             if not self.db:
                 return "Error: Database not available"
 
-            slots = self.db.get_available_bookings()
+            slots = self.db.get_available_bookings(use_primary=True)
             if not slots:
                 return "No available slots at the moment."
 
-            # Format slots as structured data
-            formatted_slots = []
-            for slot in slots:
-                date_str = slot["date"].strftime("%Y-%m-%d") if hasattr(slot["date"], "strftime") else str(slot["date"])
-                time_formatted = f"{slot['time'][:2]}:{slot['time'][2:]}"
-                formatted_slots.append(
-                    {"id": slot["id"], "date": date_str, "time": time_formatted, "time_raw": slot["time"]}
-                )
-
-            import json
-
-            return json.dumps(formatted_slots)
+            return serialization.dumps(slots)
 
         return get_booking_slots
 
@@ -147,27 +215,35 @@ class Chatbot:
                 # For now, return the slot_id to be handled by the main flow
                 return f"BOOKING_REQUESTED:{slot_id}"
 
-            # If date and time are provided, find matching slot
+            # If date and time are provided, the main flow books the slot with a single conditional update
             if date and time:
-                slots = self.db.get_available_bookings()
+                try:
+                    datetime.strptime(date, "%Y-%m-%d")
+                except ValueError:
+                    return f"Error: Invalid date {date}, use YYYY-MM-DD"
 
                 # Normalize time format (remove colons, make 4 digits)
-                time_normalized = time.replace(":", "").zfill(4)
-
-                # Find matching slot
-                for slot in slots:
-                    slot_date = (
-                        slot["date"].strftime("%Y-%m-%d") if hasattr(slot["date"], "strftime") else str(slot["date"])
-                    )
-                    if slot_date == date and slot["time"] == time_normalized:
-                        return f"BOOKING_REQUESTED:{slot['id']}"
-
-                return f"Error: No available slot found for {date} at {time}"
+                time_normalized = time.strip().replace(":", "").zfill(4)
+                if not re.fullmatch(r"\d{4}", time_normalized):
+                    return f"Error: Invalid time {time}, use HH:MM in 24-hour format"
+                return f"BOOKING_REQUESTED_AT:{date} {time_normalized}"
 
             return "Error: Please provide either a slot_id or both date and time"
 
         return book_time_slot
 
+    def _book_requested_slot(self, tool_result: str, chat_id: Optional[int]) -> Optional[int]:
+        """Book the slot requested by the book_time_slot tool, returns the booked slot ID"""
+        if not chat_id or not self.db:
+            return None
+
+        if tool_result.startswith("BOOKING_REQUESTED_AT:"):
+            slot_date, slot_time = tool_result.split(":", 1)[1].split(" ", 1)
+            return self.db.book_slot_at(slot_date, slot_time, chat_id)
+
+        booking_id = int(tool_result.split(":")[1])
+        return self.db.book_slot(booking_id, chat_id)
+
     def set_model(self, model_name: str):
         """Switch between OpenAI and Gemini"""
         if model_name in ["openai", "gemini"]:
@@ -180,6 +256,101 @@ class Chatbot:
         """Get the current active model"""
         return self.current_model
 
+    def _invoke_model(
+        self, model_with_tools, messages: List, chat_id: Optional[int], model_key: str, metrics: Dict[str, Any]
+    ):
+        """Invoke the model, record token usage and latency for the call and add them to the turn metrics"""
+        start = time.perf_counter()
+        response = model_with_tools.invoke(messages)
+        latency_ms = int((time.perf_counter() - start) * 1000)
+
+        usage = UsageLedger.extract_usage(response)
+        if self.usage_ledger:
+            self.usage_ledger.record(chat_id, self.current_model, self.model_names[model_key], usage, latency_ms)
+
+        cached_ratio = usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+        print(
+            f"Model call {self.model_names[model_key]}: {usage['prompt_tokens']} prompt tokens, "
+            f"{usage['cached_tokens']} cached ({cached_ratio:.0%}), {latency_ms}ms"
+        )
+
+        metrics["model_calls"] += 1
+        metrics["phases_ms"]["model"] += latency_ms
+        for key, value in usage.items():
+            metrics[key] += value
+        metrics["calls"].append({**usage, "cached_ratio": round(cached_ratio, 4), "latency_ms": latency_ms})
+
+        return response
+
+    def _prefetch_booking_slots(
+        self, user_message: str, previous: List[Dict[str, str]]
+    ) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Detect scheduling intent with a local classifier and, if found, return the available slots
+        grouped by date so they can be sent with the student message instead of via get_booking_slots,
+        along with the slots themselves so the turn can check whether they were used.
+        """
+        if not self.db:
+            return None, []
+
+        if not has_booking_intent(user_message, previous):
+            return None, []
+
+        slots = self.db.get_available_bookings(use_primary=True)
+        if not slots:
+            return "AVAILABLE BOOKING SLOTS: none at the moment.", []
+        header = "AVAILABLE BOOKING SLOTS (already retrieved, no need to call get_booking_slots):"
+        return f"{header}\n{format_slots_by_date(slots)}", slots
+
+    def _record_prefetch(self, prefetched: bool, used_slots: bool, called_get_slots: bool, latency_ms: int):
+        """
+        Update the prefetch counters for a completed turn.
+        A hit is a prefetched turn that used the slots (booked or offered one) without calling get_booking_slots;
+        a prefetched turn that did neither is a false positive of the intent classifier.
+        """
+        with self._prefetch_lock:
+            stats = self._prefetch_stats
+            stats["turns"] += 1
+            if prefetched:
+                stats["prefetched"] += 1
+            if prefetched and not called_get_slots:
+                if used_slots:
+                    stats["hits"] += 1
+                    stats["hit_latency_ms"] += latency_ms
+                else:
+                    stats["false_positives"] += 1
+            elif not prefetched and called_get_slots:
+                stats["misses"] += 1
+            if called_get_slots:
+                stats["slow_path_turns"] += 1
+                stats["slow_path_latency_ms"] += latency_ms
+
+    def get_prefetch_stats(self) -> Dict[str, Any]:
+        """Get the booking prefetch hit rate and the estimated latency saved"""
+        with self._prefetch_lock:
+            stats = dict(self._prefetch_stats)
+
+        booking_turns = stats["prefetched"] - stats["false_positives"] + stats["misses"]
+        avg_hit_latency = stats["hit_latency_ms"] / stats["hits"] if stats["hits"] else None
+        avg_slow_latency = (
+            stats["slow_path_latency_ms"] / stats["slow_path_turns"] if stats["slow_path_turns"] else None
+        )
+        saved_ms = None
+        if avg_hit_latency is not None and avg_slow_latency is not None:
+            saved_ms = int((avg_slow_latency - avg_hit_latency) * stats["hits"])
+
+        return {
+            "turns": stats["turns"],
+            "prefetched": stats["prefetched"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "false_positives": stats["false_positives"],
+            "hit_rate": stats["hits"] / booking_turns if booking_turns else None,
+            "avg_hit_latency_ms": avg_hit_latency,
+            "avg_slow_path_latency_ms": avg_slow_latency,
+            "estimated_saved_ms": saved_ms,
+        }
+
     def _get_system_prompt(self) -> str:
         """Generate system prompt with school data"""
         return f"""You are a helpful chatbot assistant for Havana University. Your role is to help prospective students learn about the school.
@@ -191,7 +362,7 @@ IMPORTANT INSTRUCTIONS:
 4. If a student explicitly asks to speak with a human, use the human_escalation tool immediately.
 
 BOOKING CALLS:
-5. When a student wants to schedule a call or meeting, use the get_booking_slots tool to retrieve available times.
+5. When a student wants to schedule a call or meeting, use the get_booking_slots tool to retrieve available times. If the student's message already includes AVAILABLE BOOKING SLOTS, use those instead of calling the tool.
 6. Present the available slots in a friendly, natural way (don't show raw JSON). Format dates nicely and group by date.
 7. When a student selects a time slot, use the book_time_slot tool. You can accept:
    - Specific slot IDs (e.g., "I'll take slot 42")
@@ -213,10 +384,20 @@ Be friendly, concise, and helpful. Always maintain a professional tone. Use your
             'response': str,
             'needs_escalation': bool,
             'booking_id': int (optional),
-            'error': str (optional)
+            'error': str (optional),
+            'metrics': dict (optional) - model, token, tool call counts and per-phase latency for the turn
         }
         """
+        # Stop spending tokens on chats that have used up their budget
+        if self.usage_ledger and self.usage_ledger.is_chat_over_budget(chat_id):
+            return {
+                "response": "Let me connect you with one of our advisors who can help you further.",
+                "needs_escalation": True,
+                "error": "Chat token budget exceeded",
+            }
+
         # Select the active model
+        model_key = self.current_model
         if self.current_model == "openai":
             model = self.openai_model
             if not model:
@@ -234,40 +415,80 @@ Be friendly, concise, and helpful. Always maintain a professional tone. Use your
                     "error": "Model not configured",
                 }
 
-        try:
-            # Bind tools to the model
-            model_with_tools = model.bind_tools(self.tools)
-
-            # Prepare messages
-            messages = [SystemMessage(content=self._get_system_prompt())]
-
-            # Add chat history if provided
-            if chat_history:
-                for msg in chat_history[-10:]:  # Include last 10 messages for context
-                    if msg["role"] == "human":
-                        messages.append(HumanMessage(content=msg["message"]))
-                    elif msg["role"] == "ai":
-                        messages.append(AIMessage(content=msg["message"]))
+        # Fall back to the cheaper model once the daily token budget is used up
+        if self.usage_ledger and self.usage_ledger.is_daily_over_budget():
+            economy_model = self.openai_economy_model if self.current_model == "openai" else self.gemini_economy_model
+            if economy_model:
+                model = economy_model
+                model_key = f"{self.current_model}_economy"
+
+        metrics = {
+            "model": self.model_names[model_key],
+            "model_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "cached_ratio": 0.0,
+            "calls": [],
+            "knowledge_base_version": None,
+            "tool_calls": [],
+            "phases_ms": {"prepare": 0, "prefetch": 0, "model": 0, "tools": 0, "total": 0},
+        }
 
-            # Add current user message
-            messages.append(HumanMessage(content=user_message))
+        try:
+            turn_start = time.perf_counter()
+
+            # Reuse the system prompt and tool binding, so the prefix (tools, instructions and school data)
+            # is byte-identical between calls and provider prompt caching can hit
+            self._refresh_knowledge_base()
+            model_with_tools = self._get_bound_model(model_key, model)
+            metrics["knowledge_base_version"] = self.knowledge_base_version
+
+            # Stable prefix first, then the recent history, then the current message
+            messages = [self.system_message]
+
+            # The history passed in by app.py already ends with the current student message
+            previous = list(chat_history or [])
+            if previous and previous[-1]["role"] == "human" and previous[-1]["message"] == user_message:
+                previous = previous[:-1]
+
+            # Include the most recent messages for context (a window of 0 sends no history)
+            window = max(0, self.history_window)
+            for msg in previous[max(0, len(previous) - window) :]:
+                if msg["role"] == "human":
+                    messages.append(HumanMessage(content=msg["message"]))
+                elif msg["role"] == "ai":
+                    messages.append(AIMessage(content=msg["message"]))
+
+            # Add current user message, with the available slots if the student wants to book a call
+            phase_start = time.perf_counter()
+            prefetched_slots, slots = self._prefetch_booking_slots(user_message, previous)
+            metrics["phases_ms"]["prefetch"] = round((time.perf_counter() - phase_start) * 1000, 1)
+            metrics["phases_ms"]["prepare"] = round((phase_start - turn_start) * 1000, 1)
+            if prefetched_slots:
+                messages.append(HumanMessage(content=f"{user_message}\n\n{prefetched_slots}"))
+            else:
+                messages.append(HumanMessage(content=user_message))
 
             # Generate response
-            response = model_with_tools.invoke(messages)
+            response = self._invoke_model(model_with_tools, messages, chat_id, model_key, metrics)
 
             # Check if model wants to use tools
             needs_escalation = False
             booking_id = None
             tool_results = []
+            called_tools = []
 
             if hasattr(response, "tool_calls") and response.tool_calls:
                 # Execute tool calls
                 messages.append(response)  # Add the AI message with tool calls
 
+                phase_start = time.perf_counter()
                 for tool_call in response.tool_calls:
                     tool_name = tool_call.get("name")
                     tool_args = tool_call.get("args", {})
                     tool_call_id = tool_call.get("id", "")
+                    called_tools.append(tool_name)
 
                     # Find and execute the tool
                     tool_result = None
@@ -280,15 +501,14 @@ Be friendly, concise, and helpful. Always maintain a professional tone. Use your
                             if isinstance(result, str):
                                 if result.startswith("ESCALATION_TRIGGERED:"):
                                     needs_escalation = True
-                                elif result.startswith("BOOKING_REQUESTED:"):
-                                    booking_id = int(result.split(":")[1])
+                                elif result.startswith("BOOKING_REQUESTED"):
                                     # Actually book the slot
-                                    if chat_id and self.db:
-                                        success = self.db.book_slot(booking_id, chat_id)
-                                        if success:
-                                            tool_result = "Booking successful"
-                                        else:
-                                            tool_result = "Booking failed - slot may no longer be available"
+                                    booked_id = self._book_requested_slot(result, chat_id)
+                                    if booked_id:
+                                        booking_id = booked_id
+                                        tool_result = "Booking successful"
+                                    else:
+                                        tool_result = "Booking failed - slot may no longer be available"
                             break
 
                     # Add tool result as ToolMessage
@@ -297,15 +517,26 @@ Be friendly, concise, and helpful. Always maintain a professional tone. Use your
                             ToolMessage(content=str(tool_result), tool_call_id=tool_call_id, name=tool_name)
                         )
                         tool_results.append({"tool": tool_name, "result": tool_result})
+                metrics["phases_ms"]["tools"] = round((time.perf_counter() - phase_start) * 1000, 1)
 
                 # Generate final response with tool results
-                final_response = model_with_tools.invoke(messages)
+                final_response = self._invoke_model(model_with_tools, messages, chat_id, model_key, metrics)
                 bot_response = final_response.content
             else:
                 # No tools called, use the direct response
                 bot_response = response.content
 
-            result = {"response": bot_response, "needs_escalation": needs_escalation}
+            latency_ms = int((time.perf_counter() - turn_start) * 1000)
+            used_slots = "book_time_slot" in called_tools or mentions_slots(str(bot_response), slots)
+            self._record_prefetch(
+                bool(prefetched_slots), used_slots, "get_booking_slots" in called_tools, latency_ms
+            )
+            metrics["tool_calls"] = called_tools
+            if metrics["prompt_tokens"]:
+                metrics["cached_ratio"] = round(metrics["cached_tokens"] / metrics["prompt_tokens"], 4)
+            metrics["phases_ms"]["total"] = round((time.perf_counter() - turn_start) * 1000, 1)
+
+            result = {"response": bot_response, "needs_escalation": needs_escalation, "metrics": metrics}
 
             if booking_id:
                 result["booking_id"] = booking_id
@@ -321,4 +552,5 @@ Be friendly, concise, and helpful. Always maintain a professional tone. Use your
                 "response": "I'm having trouble processing your request. Would you like to speak with a human advisor?",
                 "needs_escalation": True,
                 "error": str(e),
+                "metrics": metrics,
             }
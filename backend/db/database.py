@@ -1,26 +1,82 @@
+import itertools
 import os
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypedDict
 
 import mysql.connector
 from mysql.connector import Error, pooling
 
 
+# Row types returned by the chat and booking queries. Timestamps stay datetime/date objects,
+# the shared orjson serializer encodes them natively as ISO 8601 strings.
+class ChatRow(TypedDict):
+    id: int
+    is_human_enabled: int
+    created_at: Optional[datetime]
+
+
+class MessageRow(TypedDict):
+    id: int
+    chat_id: int
+    role: str
+    message: str
+    created_at: Optional[datetime]
+
+
+class BookingSlotRow(TypedDict):
+    id: int
+    date: date
+    time: str  # HHMM
+    display_time: str  # HH:MM
+
+
 class Database:
+    """
+    MySQL access through a primary connection pool and optional read-replica pools.
+
+    Writes always go to the primary. Reads (fetch_one, fetch_all, stream_all) go to a healthy
+    replica unless `use_primary=True` is passed, or the read is for a chat that was written to
+    within the last DB_STICKY_SECONDS (read-your-writes). Replicas that are down or lag more than
+    DB_REPLICA_MAX_LAG seconds behind the primary are skipped and reads fall back to the primary.
+
+    Pooled connections run in autocommit mode and are not reset when returned to the pool, so a
+    single statement costs one round trip. Multi-statement writes use explicit transactions, and
+    session() groups the queries of a student turn on one connection.
+    """
+
     def __init__(self):
         self.host = os.getenv("DB_HOST", "localhost")
         self.port = int(os.getenv("DB_PORT", "3306"))
         self.database = os.getenv("DB_NAME", "havana_dev")
         self.user = os.getenv("DB_USER", "admin")
         self.password = os.getenv("DB_PASSWORD", "password")
+        self.pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
         self.connection_pool = None
 
+        # Read replicas as comma-separated host:port pairs, using the primary's credentials
+        self.replica_addresses = [
+            address.strip() for address in os.getenv("DB_REPLICAS", "").split(",") if address.strip()
+        ]
+        self.replica_max_lag = float(os.getenv("DB_REPLICA_MAX_LAG", "2"))
+        self.replica_check_interval = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+        self.sticky_seconds = float(os.getenv("DB_STICKY_SECONDS", "5"))
+        self.replicas: List[Dict[str, Any]] = []
+        self._replica_cycle = None
+
+        self._lock = threading.Lock()
+        self._recent_writes: Dict[int, float] = {}  # {chat_id: monotonic time until reads stay on the primary}
+
     def connect(self):
-        """Establish database connection pool"""
+        """Establish the primary connection pool and any read-replica pools"""
         try:
             self.connection_pool = pooling.MySQLConnectionPool(
                 pool_name="havana_pool",
-                pool_size=5,
-                pool_reset_session=True,
+                pool_size=self.pool_size,
+                pool_reset_session=False,
+                autocommit=True,
                 host=self.host,
                 port=self.port,
                 database=self.database,
@@ -28,24 +84,138 @@ class Database:
                 password=self.password,
             )
             print(f"Successfully created connection pool to MySQL database: {self.database}")
-            return True
         except Error as e:
             print(f"Error creating connection pool: {e}")
             return False
 
+        for index, address in enumerate(self.replica_addresses):
+            host, _, port = address.partition(":")
+            try:
+                replica_pool = pooling.MySQLConnectionPool(
+                    pool_name=f"havana_replica_pool_{index}",
+                    pool_size=self.pool_size,
+                    pool_reset_session=False,
+                    autocommit=True,
+                    host=host,
+                    port=int(port or "3306"),
+                    database=self.database,
+                    user=self.user,
+                    password=self.password,
+                )
+                self.replicas.append(
+                    {
+                        "address": address,
+                        "pool": replica_pool,
+                        "healthy": False,
+                        "checked_at": 0.0,
+                        "check_lock": threading.Lock(),
+                    }
+                )
+                print(f"Successfully created connection pool to MySQL replica: {address}")
+            except Error as e:
+                # The app keeps working on the primary alone
+                print(f"Error creating connection pool to replica {address}: {e}")
+
+        self._replica_cycle = itertools.cycle(self.replicas) if self.replicas else None
+        return True
+
     def disconnect(self):
         """Close database connection pool"""
         if self.connection_pool:
             # Connection pools don't have a close method, connections are automatically managed
             self.connection_pool = None
+            self.replicas = []
+            self._replica_cycle = None
             print("MySQL connection pool closed")
 
-    def _get_connection(self):
-        """Get a connection from the pool"""
+    def _get_connection(self, read_only: bool = False, chat_id: Optional[int] = None):
+        """
+        Get a connection from the pool.
+        Read-only connections come from a healthy replica when one is available and the chat is not sticky.
+        """
+        if read_only and not self._is_sticky(chat_id):
+            replica = self._choose_replica()
+            if replica:
+                try:
+                    return replica["pool"].get_connection()
+                except Error as e:
+                    print(f"Error connecting to replica {replica['address']}, using primary: {e}")
+                    replica["healthy"] = False
+
         if not self.connection_pool:
             raise Exception("Connection pool not initialized")
         return self.connection_pool.get_connection()
 
+    def _is_replica_connection(self, connection) -> bool:
+        """Check if a pooled connection belongs to a replica pool"""
+        return getattr(connection, "pool_name", "").startswith("havana_replica_pool")
+
+    def _mark_chat_written(self, chat_id: Optional[int]):
+        """Keep reads for a chat on the primary for a short window after it was written to"""
+        if not chat_id or not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[chat_id] = now + self.sticky_seconds
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {cid: until for cid, until in self._recent_writes.items() if until > now}
+
+    def _is_sticky(self, chat_id: Optional[int]) -> bool:
+        """Check if reads for a chat must go to the primary"""
+        if not chat_id:
+            return False
+        with self._lock:
+            until = self._recent_writes.get(chat_id)
+        return until is not None and until > time.monotonic()
+
+    def _choose_replica(self) -> Optional[Dict[str, Any]]:
+        """Pick the next healthy replica in round-robin order"""
+        for _ in range(len(self.replicas)):
+            replica = next(self._replica_cycle)
+            if self._check_replica(replica):
+                return replica
+        return None
+
+    def _check_replica(self, replica: Dict[str, Any]) -> bool:
+        """
+        Check (at most every DB_REPLICA_CHECK_INTERVAL seconds) that a replica is up and not lagging.
+        Only one caller probes a replica at a time, the others use the last known health meanwhile.
+        """
+        if time.monotonic() - replica["checked_at"] < self.replica_check_interval:
+            return replica["healthy"]
+        if not replica["check_lock"].acquire(blocking=False):
+            return replica["healthy"]
+        if time.monotonic() - replica["checked_at"] < self.replica_check_interval:
+            # Another caller finished a probe between the first check and acquiring the lock
+            replica["check_lock"].release()
+            return replica["healthy"]
+
+        connection = None
+        cursor = None
+        healthy = False
+        try:
+            connection = replica["pool"].get_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SHOW REPLICA STATUS")
+            status = cursor.fetchone()
+            lag = status.get("Seconds_Behind_Source") if status else None
+            # No status means the server is not replicating, a NULL lag means replication is stopped
+            healthy = lag is not None and lag <= self.replica_max_lag
+            if not healthy:
+                print(f"Replica {replica['address']} unavailable for reads (lag: {lag})")
+        except Error as e:
+            print(f"Error checking replica {replica['address']}: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+            replica["healthy"] = healthy
+            replica["checked_at"] = time.monotonic()
+            replica["check_lock"].release()
+
+        return healthy
+
     def execute_query(self, query: str, params: tuple = None) -> bool:
         """Execute a query that doesn't return results (INSERT, UPDATE, DELETE)"""
         connection = None
@@ -54,12 +224,9 @@ class Database:
             connection = self._get_connection()
             cursor = connection.cursor()
             cursor.execute(query, params or ())
-            connection.commit()
             return True
         except Error as e:
             print(f"Error executing query: {e}")
-            if connection:
-                connection.rollback()
             return False
         finally:
             if cursor:
@@ -67,62 +234,205 @@ class Database:
             if connection:
                 connection.close()
 
-    def fetch_one(self, query: str, params: tuple = None) -> Optional[Dict[str, Any]]:
-        """Fetch a single row"""
+    def execute_update(self, query: str, params: tuple = None) -> int:
+        """Execute an UPDATE or DELETE and return the number of affected rows (-1 on error)"""
         connection = None
         cursor = None
         try:
             connection = self._get_connection()
-            cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor()
             cursor.execute(query, params or ())
-            result = cursor.fetchone()
-            return result
+            return cursor.rowcount
         except Error as e:
-            print(f"Error fetching data: {e}")
-            return None
+            print(f"Error executing query: {e}")
+            return -1
         finally:
             if cursor:
                 cursor.close()
             if connection:
                 connection.close()
 
-    def fetch_all(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
-        """Fetch all rows"""
+    def execute_many(self, query: str, params_list: List[tuple]) -> bool:
+        """Execute a query once per parameter tuple in a single transaction"""
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            connection.start_transaction()
+            cursor.executemany(query, params_list)
+            connection.commit()
+            return True
+        except Error as e:
+            print(f"Error executing batch query: {e}")
+            if connection:
+                connection.rollback()
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def execute_transaction(self, operations: List[Tuple[str, Any]]) -> bool:
+        """
+        Execute several queries in a single transaction.
+        Each operation is a (query, params) pair, a list of params runs the query once per tuple.
+        """
         connection = None
         cursor = None
         try:
             connection = self._get_connection()
+            cursor = connection.cursor()
+            connection.start_transaction()
+            for query, params in operations:
+                if isinstance(params, list):
+                    if params:
+                        cursor.executemany(query, params)
+                else:
+                    cursor.execute(query, params or ())
+            connection.commit()
+            return True
+        except Error as e:
+            print(f"Error executing transaction: {e}")
+            if connection:
+                connection.rollback()
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def _fetch(self, query: str, params: tuple, fetch_all: bool, chat_id: Optional[int], use_primary: bool):
+        """Run a read query, retrying once on the primary if a replica fails mid-query"""
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_connection(read_only=not use_primary, chat_id=chat_id)
             cursor = connection.cursor(dictionary=True)
             cursor.execute(query, params or ())
-            results = cursor.fetchall()
-            return results
+            return cursor.fetchall() if fetch_all else cursor.fetchone()
         except Error as e:
-            print(f"Error fetching data: {e}")
-            return []
+            if not (connection and self._is_replica_connection(connection)):
+                print(f"Error fetching data: {e}")
+                return [] if fetch_all else None
+            print(f"Error fetching data from replica, retrying on primary: {e}")
+            for replica in self.replicas:
+                if replica["pool"].pool_name == connection.pool_name:
+                    replica["healthy"] = False
         finally:
             if cursor:
                 cursor.close()
             if connection:
                 connection.close()
 
-    def get_last_insert_id(self, connection) -> Optional[int]:
-        """Get the last inserted ID from a given connection"""
+        return self._fetch(query, params, fetch_all, chat_id, use_primary=True)
+
+    def fetch_one(
+        self, query: str, params: tuple = None, chat_id: int = None, use_primary: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Fetch a single row (from a replica unless use_primary is set or the chat was just written to)"""
+        return self._fetch(query, params, False, chat_id, use_primary)
+
+    def fetch_all(
+        self, query: str, params: tuple = None, chat_id: int = None, use_primary: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Fetch all rows (from a replica unless use_primary is set or the chat was just written to)"""
+        return self._fetch(query, params, True, chat_id, use_primary)
+
+    def stream_all(self, query: str, params: tuple = None, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Stream rows through an unbuffered cursor (on a replica when available), fetching `chunk_size` rows at a time.
+        Uses a dedicated connection outside the pools, so slow consumers never starve request handlers,
+        and raises on errors so a truncated stream is not mistaken for a complete one.
+        """
+        connection = None
+        cursor = None
+        finished = False
+        try:
+            connection = self._connect_for_streaming()
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+            finished = True
+        except Error as e:
+            print(f"Error streaming data: {e}")
+            raise
+        finally:
+            if connection and finished:
+                cursor.close()
+                connection.close()
+            elif connection:
+                # The consumer stopped early or the query failed, drop the socket instead of reading the remaining rows
+                connection.shutdown()
+
+    def _connect_for_streaming(self):
+        """Open a non-pooled connection to a healthy replica, or to the primary if none is available"""
+        settings = {"database": self.database, "user": self.user, "password": self.password, "autocommit": True}
+        replica = self._choose_replica()
+        if replica:
+            host, _, port = replica["address"].partition(":")
+            try:
+                return mysql.connector.connect(host=host, port=int(port or "3306"), **settings)
+            except Error as e:
+                print(f"Error connecting to replica {replica['address']}, using primary: {e}")
+                replica["healthy"] = False
+        return mysql.connector.connect(host=self.host, port=self.port, **settings)
+
+    @contextmanager
+    def named_lock(self, name: str) -> Iterator[bool]:
+        """
+        Hold a MySQL named lock (GET_LOCK) on a dedicated primary connection for the duration of the block.
+        Yields False without waiting if another connection holds the lock.
+        """
+        connection = None
         cursor = None
+        acquired = False
         try:
+            connection = self._get_connection()
             cursor = connection.cursor()
-            cursor.execute("SELECT LAST_INSERT_ID()")
-            result = cursor.fetchone()
-            return result[0] if result else None
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+            acquired = cursor.fetchone()[0] == 1
         except Error as e:
-            print(f"Error getting last insert ID: {e}")
-            return None
+            print(f"Error acquiring lock {name}: {e}")
+
+        try:
+            yield acquired
         finally:
+            if acquired:
+                try:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                    cursor.fetchone()
+                except Error as e:
+                    print(f"Error releasing lock {name}: {e}")
             if cursor:
                 cursor.close()
+            if connection:
+                connection.close()
+
+    @contextmanager
+    def session(self) -> Iterator["ChatSession"]:
+        """
+        Hold one primary connection for a unit of work, e.g. one side of a student turn.
+        Writes queued on the session are committed together when the block exits without an exception.
+        Do not keep a session open across a model call, it holds a pooled connection.
+        """
+        connection = self._get_connection()
+        session = ChatSession(self, connection)
+        try:
+            yield session
+            session.commit()
+        finally:
+            session.close()
 
     # Chat operations
     def create_chat(self) -> Optional[int]:
-        """Create a new chat and return its ID"""
+        """Create a new chat and return its ID (taken from the INSERT's OK packet, no extra query)"""
         connection = None
         cursor = None
         try:
@@ -130,13 +440,11 @@ class Database:
             cursor = connection.cursor()
             query = "INSERT INTO chats (is_human_enabled) VALUES (FALSE)"
             cursor.execute(query)
-            connection.commit()
-            last_id = self.get_last_insert_id(connection)
-            return last_id
+            chat_id = cursor.lastrowid
+            self._mark_chat_written(chat_id)
+            return chat_id
         except Error as e:
             print(f"Error creating chat: {e}")
-            if connection:
-                connection.rollback()
             return None
         finally:
             if cursor:
@@ -144,7 +452,7 @@ class Database:
             if connection:
                 connection.close()
 
-    def get_all_chats(self) -> List[Dict[str, Any]]:
+    def get_all_chats(self) -> List[ChatRow]:
         """Get all non-deleted chats"""
         query = """
             SELECT id, is_human_enabled, created_at
@@ -154,14 +462,14 @@ class Database:
         """
         return self.fetch_all(query)
 
-    def get_chat_by_id(self, chat_id: int) -> Optional[Dict[str, Any]]:
+    def get_chat_by_id(self, chat_id: int) -> Optional[ChatRow]:
         """Get a specific chat by ID"""
         query = """
             SELECT id, is_human_enabled, created_at
             FROM chats
             WHERE id = %s AND deleted_at IS NULL
         """
-        return self.fetch_one(query, (chat_id,))
+        return self.fetch_one(query, (chat_id,), chat_id=chat_id)
 
     def update_chat_human_enabled(self, chat_id: int, is_enabled: bool) -> bool:
         """Update the is_human_enabled flag for a chat"""
@@ -170,6 +478,7 @@ class Database:
             SET is_human_enabled = %s
             WHERE id = %s AND deleted_at IS NULL
         """
+        self._mark_chat_written(chat_id)
         return self.execute_query(query, (is_enabled, chat_id))
 
     # Chat history operations
@@ -179,34 +488,576 @@ class Database:
             INSERT INTO chat_history (chat_id, role, message)
             VALUES (%s, %s, %s)
         """
+        self._mark_chat_written(chat_id)
         return self.execute_query(query, (chat_id, role, message))
 
-    def get_chat_history(self, chat_id: int) -> List[Dict[str, Any]]:
+    def get_chat_history(self, chat_id: int) -> List[MessageRow]:
         """Get all messages for a chat"""
         query = """
             SELECT id, chat_id, role, message, created_at
             FROM chat_history
             WHERE chat_id = %s AND deleted_at IS NULL
-            ORDER BY created_at ASC
+            ORDER BY created_at ASC, id ASC
+        """
+        return self.fetch_all(query, (chat_id,), chat_id=chat_id)
+
+    def stream_chat_history(
+        self, start=None, end=None, since_id: int = None, chunk_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream non-deleted messages of non-deleted chats in ID order.
+        `start`/`end` bound created_at (end exclusive), `since_id` only returns messages with a greater ID.
+        """
+        conditions = ["h.deleted_at IS NULL", "c.deleted_at IS NULL"]
+        params = []
+        if since_id is not None:
+            conditions.append("h.id > %s")
+            params.append(since_id)
+        if start is not None:
+            conditions.append("h.created_at >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("h.created_at < %s")
+            params.append(end)
+
+        query = f"""
+            SELECT h.id, h.chat_id, h.role, h.message, h.created_at, c.is_human_enabled
+            FROM chat_history h
+            JOIN chats c ON c.id = h.chat_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY h.id ASC
         """
-        return self.fetch_all(query, (chat_id,))
+        return self.stream_all(query, tuple(params), chunk_size)
+
+    def search_messages(
+        self,
+        search_query: str,
+        role: str = None,
+        start=None,
+        end=None,
+        is_human_enabled: bool = None,
+        after_score: float = None,
+        after_id: int = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        Full-text search over non-deleted messages, ordered by relevance then ID.
+        Pass the score and ID of the last result as `after_score`/`after_id` to fetch the next page.
+        """
+        conditions = [
+            "MATCH(h.message) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+            "h.deleted_at IS NULL",
+            "c.deleted_at IS NULL",
+        ]
+        params = [search_query, search_query]
+        if role is not None:
+            conditions.append("h.role = %s")
+            params.append(role)
+        if start is not None:
+            conditions.append("h.created_at >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("h.created_at < %s")
+            params.append(end)
+        if is_human_enabled is not None:
+            conditions.append("c.is_human_enabled = %s")
+            params.append(is_human_enabled)
+
+        keyset = ""
+        if after_score is not None and after_id is not None:
+            keyset = "WHERE ranked.score < %s OR (ranked.score = %s AND ranked.id < %s)"
+            params.extend([after_score, after_score, after_id])
+        params.append(limit)
+
+        query = f"""
+            SELECT ranked.*
+            FROM (
+                SELECT
+                    h.id, h.chat_id, h.role, h.message, h.created_at, c.is_human_enabled,
+                    MATCH(h.message) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+                FROM chat_history h
+                JOIN chats c ON c.id = h.chat_id
+                WHERE {" AND ".join(conditions)}
+            ) ranked
+            {keyset}
+            ORDER BY ranked.score DESC, ranked.id DESC
+            LIMIT %s
+        """
+        return self.fetch_all(query, tuple(params))
 
     # Booking operations
-    def get_available_bookings(self) -> List[Dict[str, Any]]:
-        """Get all available booking slots (where chat_id is NULL)"""
+    def get_available_bookings(self, use_primary: bool = False) -> List[BookingSlotRow]:
+        """
+        Get all available booking slots (where chat_id is NULL), one per date and time across advisors.
+        Pass use_primary=True when the student is about to pick a slot, so recently taken slots are not offered.
+        """
         query = """
-            SELECT id, date, time
+            SELECT MIN(id) AS id, date, time, CONCAT(LEFT(time, 2), ':', RIGHT(time, 2)) AS display_time
             FROM bookings
             WHERE chat_id IS NULL AND deleted_at IS NULL AND date >= CURDATE()
+            GROUP BY date, time
             ORDER BY date ASC, time ASC
         """
-        return self.fetch_all(query)
+        return self.fetch_all(query, use_primary=use_primary)
 
-    def book_slot(self, booking_id: int, chat_id: int) -> bool:
-        """Book a slot for a chat"""
+    def book_slot(self, booking_id: int, chat_id: int) -> Optional[int]:
+        """
+        Book a slot for a chat, or another advisor's free slot at the same date and time if another chat took it.
+        Returns the booked slot ID, or None if the slot does not exist or no slot is free at its date and time.
+        """
         query = """
             UPDATE bookings
             SET chat_id = %s
             WHERE id = %s AND chat_id IS NULL AND deleted_at IS NULL
         """
-        return self.execute_query(query, (chat_id, booking_id))
+        self._mark_chat_written(chat_id)
+        if self.execute_update(query, (chat_id, booking_id)) == 1:
+            return booking_id
+
+        slot = self.fetch_one(
+            "SELECT date, time, chat_id FROM bookings WHERE id = %s AND deleted_at IS NULL",
+            (booking_id,),
+            use_primary=True,
+        )
+        if not slot:
+            return None
+        if slot["chat_id"] == chat_id:
+            # Already booked by this chat (e.g. the student confirmed twice), never book a second advisor
+            return booking_id
+        # get_available_bookings offers one slot ID per date and time, other advisors may still be free then
+        return self.book_slot_at(slot["date"].isoformat(), slot["time"], chat_id)
+
+    def book_slot_at(self, slot_date: str, slot_time: str, chat_id: int) -> Optional[int]:
+        """
+        Book any free slot at a date (YYYY-MM-DD) and time (HHMM) in a single statement.
+        Returns the booked slot ID, or None if no slot was free.
+        """
+        self._mark_chat_written(chat_id)
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            # LAST_INSERT_ID(id) makes the updated row's ID available as lastrowid without a SELECT
+            query = """
+                UPDATE bookings
+                SET chat_id = %s, id = LAST_INSERT_ID(id)
+                WHERE date = %s AND time = %s AND chat_id IS NULL AND deleted_at IS NULL
+                ORDER BY id ASC
+                LIMIT 1
+            """
+            cursor.execute(query, (chat_id, slot_date, slot_time))
+            booked = cursor.rowcount == 1
+            booking_id = cursor.lastrowid
+            return booking_id if booked else None
+        except Error as e:
+            print(f"Error booking slot: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def add_booking_slots(self, slots: List[Tuple[date, str, str]]) -> bool:
+        """Insert (date, time, advisor) slots in one statement, skipping slots that already exist"""
+        if not slots:
+            return True
+        query = """
+            INSERT INTO bookings (date, time, advisor)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """
+        return self.execute_many(query, slots)
+
+    def delete_past_unbooked_slots(self, limit: int) -> int:
+        """Delete up to `limit` unbooked slots in the past, returns rows deleted"""
+        query = """
+            DELETE FROM bookings
+            WHERE chat_id IS NULL AND date < CURDATE()
+            LIMIT %s
+        """
+        return self.execute_update(query, (limit,))
+
+    # Usage operations
+    def add_usage_records(self, records: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of model usage records"""
+        if not records:
+            return True
+        query = """
+            INSERT INTO chat_usage
+                (chat_id, provider, model, prompt_tokens, completion_tokens, cached_tokens, latency_ms)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        params_list = [
+            (
+                record["chat_id"],
+                record["provider"],
+                record["model"],
+                record["prompt_tokens"],
+                record["completion_tokens"],
+                record["cached_tokens"],
+                record["latency_ms"],
+            )
+            for record in records
+        ]
+        return self.execute_many(query, params_list)
+
+    def get_chat_usage(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Get token and latency totals for a chat"""
+        query = """
+            SELECT
+                COUNT(*) AS calls,
+                CAST(COALESCE(SUM(prompt_tokens), 0) AS UNSIGNED) AS prompt_tokens,
+                CAST(COALESCE(SUM(completion_tokens), 0) AS UNSIGNED) AS completion_tokens,
+                CAST(COALESCE(SUM(cached_tokens), 0) AS UNSIGNED) AS cached_tokens,
+                CAST(COALESCE(SUM(latency_ms), 0) AS UNSIGNED) AS latency_ms
+            FROM chat_usage
+            WHERE chat_id = %s
+        """
+        return self.fetch_one(query, (chat_id,))
+
+    def get_usage_summary(self, since) -> List[Dict[str, Any]]:
+        """Get token and latency totals and the share of prompt tokens served from cache per provider and model"""
+        query = """
+            SELECT
+                provider,
+                model,
+                COUNT(*) AS calls,
+                COUNT(DISTINCT chat_id) AS chats,
+                CAST(SUM(prompt_tokens) AS UNSIGNED) AS prompt_tokens,
+                CAST(SUM(completion_tokens) AS UNSIGNED) AS completion_tokens,
+                CAST(SUM(cached_tokens) AS UNSIGNED) AS cached_tokens,
+                ROUND(SUM(cached_tokens) / NULLIF(SUM(prompt_tokens), 0), 4) AS cached_ratio,
+                CAST(AVG(latency_ms) AS UNSIGNED) AS avg_latency_ms
+            FROM chat_usage
+            WHERE created_at >= %s
+            GROUP BY provider, model
+            ORDER BY provider ASC, model ASC
+        """
+        return self.fetch_all(query, (since,))
+
+    def get_total_tokens_since(self, since) -> int:
+        """Get the total number of tokens (prompt + completion) used since a given time"""
+        query = """
+            SELECT CAST(COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS UNSIGNED) AS total_tokens
+            FROM chat_usage
+            WHERE created_at >= %s
+        """
+        result = self.fetch_one(query, (since,))
+        return result["total_tokens"] if result else 0
+
+    # Retention operations
+    def get_archivable_chat_ids(self, cutoff, limit: int) -> List[int]:
+        """
+        Get IDs of chats that are soft-deleted or have had no activity since the cutoff.
+        Chats with upcoming bookings are never archived.
+        """
+        query = """
+            SELECT c.id
+            FROM chats c
+            WHERE (
+                c.deleted_at IS NOT NULL
+                OR (
+                    c.created_at < %s
+                    AND NOT EXISTS (
+                        SELECT 1 FROM chat_history h
+                        WHERE h.chat_id = c.id AND h.created_at >= %s AND h.deleted_at IS NULL
+                    )
+                )
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM bookings b
+                WHERE b.chat_id = c.id AND b.date >= CURDATE()
+            )
+            ORDER BY c.id ASC
+            LIMIT %s
+        """
+        return [row["id"] for row in self.fetch_all(query, (cutoff, cutoff, limit), use_primary=True)]
+
+    def get_chats_for_archive(self, chat_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get full chat rows (including soft-deleted ones) for the given IDs"""
+        placeholders = ", ".join(["%s"] * len(chat_ids))
+        query = f"""
+            SELECT id, is_human_enabled, created_at, deleted_at
+            FROM chats
+            WHERE id IN ({placeholders})
+            ORDER BY id ASC
+        """
+        return self.fetch_all(query, tuple(chat_ids), use_primary=True)
+
+    def get_history_for_archive(self, chat_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get all messages (including soft-deleted ones) for the given chats"""
+        placeholders = ", ".join(["%s"] * len(chat_ids))
+        query = f"""
+            SELECT id, chat_id, role, message, created_at, deleted_at
+            FROM chat_history
+            WHERE chat_id IN ({placeholders})
+            ORDER BY chat_id ASC, id ASC
+        """
+        return self.fetch_all(query, tuple(chat_ids), use_primary=True)
+
+    def get_bookings_for_archive(self, chat_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get the bookings made by the given chats"""
+        placeholders = ", ".join(["%s"] * len(chat_ids))
+        query = f"""
+            SELECT id, chat_id, date, time
+            FROM bookings
+            WHERE chat_id IN ({placeholders})
+        """
+        return self.fetch_all(query, tuple(chat_ids), use_primary=True)
+
+    def remove_archived_chats(self, archive_entries: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """
+        Record archived chats in the manifest and delete them from the hot tables in one transaction.
+        Each entry carries the last archived message ID, chats that received a message since they were
+        read are skipped and stay in the hot tables. Returns the IDs of the removed chats, or None on error.
+        """
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            connection.start_transaction()
+
+            # Locking the chat rows blocks new messages (their foreign key check needs a shared lock on the chat)
+            chat_ids = [entry["chat_id"] for entry in archive_entries]
+            placeholders = ", ".join(["%s"] * len(chat_ids))
+            cursor.execute(f"SELECT id FROM chats WHERE id IN ({placeholders}) FOR UPDATE", tuple(chat_ids))
+            cursor.fetchall()
+            cursor.execute(
+                f"""
+                SELECT chat_id, MAX(id)
+                FROM chat_history
+                WHERE chat_id IN ({placeholders})
+                GROUP BY chat_id
+                """,
+                tuple(chat_ids),
+            )
+            last_message_ids = dict(cursor.fetchall())
+
+            unchanged = [
+                entry
+                for entry in archive_entries
+                if last_message_ids.get(entry["chat_id"], 0) <= entry["last_message_id"]
+            ]
+            skipped = len(archive_entries) - len(unchanged)
+            if skipped:
+                print(f"Skipping {skipped} chats that received messages while being archived")
+            if not unchanged:
+                connection.rollback()
+                return []
+
+            chat_ids = [entry["chat_id"] for entry in unchanged]
+            placeholders = ", ".join(["%s"] * len(chat_ids))
+            manifest_rows = [
+                (
+                    entry["chat_id"],
+                    entry["archive_month"],
+                    entry["archive_path"],
+                    entry["message_count"],
+                    entry["chat_created_at"],
+                )
+                for entry in unchanged
+            ]
+            cursor.executemany(
+                """
+                INSERT INTO chat_archive (chat_id, archive_month, archive_path, message_count, chat_created_at)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                manifest_rows,
+            )
+            cursor.execute(f"DELETE FROM chat_history WHERE chat_id IN ({placeholders})", tuple(chat_ids))
+            cursor.execute(f"DELETE FROM chats WHERE id IN ({placeholders})", tuple(chat_ids))
+            connection.commit()
+            return chat_ids
+        except Error as e:
+            print(f"Error removing archived chats: {e}")
+            if connection:
+                connection.rollback()
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def get_chat_archive_entry(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Get the archive manifest entry for a chat"""
+        query = """
+            SELECT chat_id, archive_month, archive_path, message_count, chat_created_at, archived_at
+            FROM chat_archive
+            WHERE chat_id = %s
+        """
+        return self.fetch_one(query, (chat_id,), use_primary=True)
+
+    def restore_archived_chat(
+        self, chat: Dict[str, Any], history: List[Dict[str, Any]], bookings: List[Dict[str, Any]]
+    ) -> bool:
+        """Re-insert an archived chat with its original IDs and remove it from the manifest"""
+        history_rows = [
+            (msg["id"], msg["chat_id"], msg["role"], msg["message"], msg["created_at"], msg["deleted_at"])
+            for msg in history
+        ]
+        # Only re-link bookings whose slot still exists and has not been taken since
+        booking_rows = [(chat["id"], booking["id"]) for booking in bookings]
+        self._mark_chat_written(chat["id"])
+        return self.execute_transaction(
+            [
+                (
+                    "INSERT INTO chats (id, is_human_enabled, created_at, deleted_at) VALUES (%s, %s, %s, %s)",
+                    (chat["id"], chat["is_human_enabled"], chat["created_at"], chat["deleted_at"]),
+                ),
+                (
+                    """
+                    INSERT INTO chat_history (id, chat_id, role, message, created_at, deleted_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    history_rows,
+                ),
+                ("UPDATE bookings SET chat_id = %s WHERE id = %s AND chat_id IS NULL", booking_rows),
+                ("DELETE FROM chat_archive WHERE chat_id = %s", (chat["id"],)),
+            ]
+        )
+
+    def delete_archive_entries_before(self, archive_month: str, limit: int) -> int:
+        """Delete up to `limit` manifest entries for months before the given month, returns rows deleted"""
+        query = """
+            DELETE FROM chat_archive
+            WHERE archive_month < %s
+            LIMIT %s
+        """
+        return self.execute_update(query, (archive_month, limit))
+
+    def delete_empty_chats(self, cutoff, limit: int) -> int:
+        """
+        Delete up to `limit` chats created before the cutoff that never had a message,
+        booking or model call (e.g. opened by visitors who left without typing), returns rows deleted
+        """
+        query = """
+            DELETE FROM chats
+            WHERE created_at < %s
+            AND NOT EXISTS (SELECT 1 FROM chat_history h WHERE h.chat_id = chats.id)
+            AND NOT EXISTS (SELECT 1 FROM bookings b WHERE b.chat_id = chats.id)
+            AND NOT EXISTS (SELECT 1 FROM chat_usage u WHERE u.chat_id = chats.id)
+            ORDER BY id
+            LIMIT %s
+        """
+        return self.execute_update(query, (cutoff, limit))
+
+
+class ChatSession:
+    """
+    Unit of work on a single primary connection, created by Database.session().
+
+    Reads run immediately on the held connection. Writes are queued and sent by commit():
+    queued messages become one multi-row INSERT, and a transaction is only opened when
+    there is more than one statement to run.
+    """
+
+    def __init__(self, db: Database, connection):
+        self.db = db
+        self.connection = connection
+        self.cursor = connection.cursor(dictionary=True)
+        self._messages: List[Tuple[int, str, str]] = []
+        self._updates: List[Tuple[str, tuple]] = []
+        self._written_chat_ids = set()
+
+    def get_chat_with_history(self, chat_id: int, limit: int) -> Tuple[Optional[ChatRow], List[MessageRow]]:
+        """Get a chat and its `limit` most recent messages (oldest first) in one query"""
+        query = """
+            SELECT c.id AS chat_id, c.is_human_enabled, c.created_at AS chat_created_at,
+                h.id, h.role, h.message, h.created_at
+            FROM chats c
+            LEFT JOIN (
+                SELECT id, role, message, created_at
+                FROM chat_history
+                WHERE chat_id = %s AND deleted_at IS NULL
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            ) h ON TRUE
+            WHERE c.id = %s AND c.deleted_at IS NULL
+            ORDER BY h.created_at ASC, h.id ASC
+        """
+        try:
+            self.cursor.execute(query, (chat_id, limit, chat_id))
+            rows = self.cursor.fetchall()
+        except Error as e:
+            print(f"Error fetching chat with history: {e}")
+            return None, []
+
+        if not rows:
+            return None, []
+
+        chat = {
+            "id": chat_id,
+            "is_human_enabled": rows[0]["is_human_enabled"],
+            "created_at": rows[0]["chat_created_at"],
+        }
+        history = [
+            {
+                "id": row["id"],
+                "chat_id": chat_id,
+                "role": row["role"],
+                "message": row["message"],
+                "created_at": row["created_at"],
+            }
+            for row in rows
+            if row["id"] is not None
+        ]
+        return chat, history
+
+    def add_message(self, chat_id: int, role: str, message: str):
+        """Queue a message to be added to chat history on commit"""
+        self._messages.append((chat_id, role, message))
+        self._written_chat_ids.add(chat_id)
+
+    def update_chat_human_enabled(self, chat_id: int, is_enabled: bool):
+        """Queue an update of the is_human_enabled flag on commit"""
+        query = """
+            UPDATE chats
+            SET is_human_enabled = %s
+            WHERE id = %s AND deleted_at IS NULL
+        """
+        self._updates.append((query, (is_enabled, chat_id)))
+        self._written_chat_ids.add(chat_id)
+
+    def commit(self) -> bool:
+        """Write the queued changes, returns False (and writes nothing) on error"""
+        statement_count = (1 if self._messages else 0) + len(self._updates)
+        if not statement_count:
+            return True
+
+        for chat_id in self._written_chat_ids:
+            self.db._mark_chat_written(chat_id)
+
+        try:
+            if statement_count > 1:
+                self.connection.start_transaction()
+            if self._messages:
+                query = """
+                    INSERT INTO chat_history (chat_id, role, message)
+                    VALUES (%s, %s, %s)
+                """
+                self.cursor.executemany(query, self._messages)
+            for query, params in self._updates:
+                self.cursor.execute(query, params)
+            if statement_count > 1:
+                self.connection.commit()
+            return True
+        except Error as e:
+            print(f"Error committing session: {e}")
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            return False
+        finally:
+            self._messages = []
+            self._updates = []
+            self._written_chat_ids = set()
+
+    def close(self):
+        """Return the connection to the pool, discarding uncommitted writes"""
+        self._messages = []
+        self._updates = []
+        self.cursor.close()
+        self.connection.close()
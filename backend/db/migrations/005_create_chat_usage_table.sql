@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS chat_usage (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    chat_id INT NULL DEFAULT NULL,
+    provider VARCHAR(32) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    prompt_tokens INT NOT NULL DEFAULT 0,
+    completion_tokens INT NOT NULL DEFAULT 0,
+    cached_tokens INT NOT NULL DEFAULT 0,
+    latency_ms INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_chat_usage_chat_id (chat_id),
+    INDEX idx_chat_usage_created_at (created_at)
+);
@@ -0,0 +1,14 @@
+-- Manifest of chats moved out of the hot tables into compressed archive files
+CREATE TABLE IF NOT EXISTS chat_archive (
+    chat_id INT PRIMARY KEY,
+    archive_month CHAR(7) NOT NULL,
+    archive_path VARCHAR(255) NOT NULL,
+    message_count INT NOT NULL DEFAULT 0,
+    chat_created_at TIMESTAMP NULL DEFAULT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_chat_archive_month (archive_month)
+);
+
+-- Indexes used to find archivable chats without scanning chat_history
+CREATE INDEX idx_chats_deleted_created ON chats (deleted_at, created_at);
+CREATE INDEX idx_chat_history_chat_created ON chat_history (chat_id, created_at);
@@ -0,0 +1,2 @@
+-- Full-text index used by the admin message search
+ALTER TABLE chat_history ADD FULLTEXT INDEX ft_chat_history_message (message);
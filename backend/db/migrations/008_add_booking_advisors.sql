@@ -0,0 +1,23 @@
+-- Slots are generated per advisor by slots.py instead of being seeded once
+ALTER TABLE bookings ADD COLUMN advisor VARCHAR(64) NOT NULL DEFAULT 'admissions' AFTER time;
+
+-- 1 for live slots and NULL for soft-deleted ones, so only live slots take part in the unique key
+ALTER TABLE bookings ADD COLUMN slot_active TINYINT GENERATED ALWAYS AS (IF(deleted_at IS NULL, 1, NULL)) STORED;
+
+-- The old key included the nullable deleted_at column and never matched live slots,
+-- so re-running the seed migration created duplicates. Soft-delete unbooked duplicates first.
+UPDATE bookings b
+JOIN bookings keep
+    ON keep.date = b.date
+    AND keep.time = b.time
+    AND keep.advisor = b.advisor
+    AND keep.id <> b.id
+    AND keep.deleted_at IS NULL
+    AND (keep.chat_id IS NOT NULL OR keep.id < b.id)
+SET b.deleted_at = CURRENT_TIMESTAMP
+WHERE b.chat_id IS NULL AND b.deleted_at IS NULL;
+
+ALTER TABLE bookings
+    DROP INDEX unique_booking_slot,
+    ADD UNIQUE KEY unique_booking_slot (date, time, advisor, slot_active),
+    ADD INDEX idx_bookings_available (chat_id, date, time);
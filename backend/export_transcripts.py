@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Transcript export for Havana University Chat Bot
+Streams chat history as NDJSON or CSV in constant memory
+
+Usage:
+    python export_transcripts.py [--format ndjson|csv] [--start DATE] [--end DATE] [--since-id ID] [--output FILE]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator
+
+import serialization
+from db.database import Database
+from dotenv import load_dotenv
+
+EXPORT_FIELDS = ["id", "chat_id", "role", "message", "created_at", "is_human_enabled"]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _export_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a history row into its exported form"""
+    return {
+        "id": row["id"],
+        "chat_id": row["chat_id"],
+        "role": row["role"],
+        "message": row["message"],
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        "is_human_enabled": bool(row["is_human_enabled"]),
+    }
+
+
+def format_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON, one line per message"""
+    for row in rows:
+        yield serialization.dumps(_export_row(row)) + "\n"
+
+
+def format_csv(rows: Iterable[Dict[str, Any]], chunk_size: int = 500) -> Iterator[str]:
+    """Encode rows as CSV with a header line, yielding one chunk per `chunk_size` rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(_export_row(row))
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_transcripts(
+    db, export_format: str = "ndjson", start=None, end=None, since_id: int = None
+) -> Iterator[str]:
+    """Stream chat history in the requested format"""
+    rows = db.stream_chat_history(start=start, end=end, since_id=since_id)
+    if export_format == "csv":
+        return format_csv(rows)
+    return format_ndjson(rows)
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Export chat transcripts")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Only messages created at or after this date")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Only messages created before this date")
+    parser.add_argument("--since-id", type=int, help="Only messages with an ID greater than this (incremental export)")
+    parser.add_argument("--output", help="Output file (defaults to stdout)")
+    args = parser.parse_args()
+
+    # Keep connection messages out of the export when writing to stdout
+    db = Database()
+    with contextlib.redirect_stdout(sys.stderr):
+        if not db.connect():
+            raise SystemExit(1)
+
+    output = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for chunk in export_transcripts(db, args.format, args.start, args.end, args.since_id):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import re
+from typing import Any, Dict, List
+
+# Words that on their own signal the student wants to schedule a call
+BOOKING_KEYWORDS = re.compile(
+    r"\b(book|booking|schedul\w*|appointment|slots?|reserve)\b",
+    re.IGNORECASE,
+)
+
+# Words that only signal a call alongside other evidence ("available" and "advisor" alone are not enough)
+WEAK_BOOKING_KEYWORDS = re.compile(
+    r"\b(call|meeting|meet|advisor|availability|talk)\b",
+    re.IGNORECASE,
+)
+
+# Dates and times the student may pick a slot with
+TIME_EXPRESSIONS = re.compile(
+    r"\b(\d{1,2}(:\d{2})?\s?(am|pm)|\d{1,2}:\d{2}|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.IGNORECASE,
+)
+
+# Vague times that only count alongside a keyword in the same message
+VAGUE_TIME_EXPRESSIONS = re.compile(r"\b(today|tomorrow|next week|morning|afternoon)\b", re.IGNORECASE)
+
+# Minimum score for a message to count as scheduling intent
+BOOKING_INTENT_THRESHOLD = 2
+
+
+def booking_intent_score(message: str, history: List[Dict[str, Any]] = None) -> int:
+    """
+    Score how likely a message is about booking a call.
+    A booking keyword in the message scores 2, a weak keyword 1 and a date or time 1. A vague time
+    ("today", "morning") scores 1 only next to a keyword, and a booking keyword in the last two history
+    messages scores 1 only when the message has a keyword or time (e.g. the student picking a time
+    after being offered slots).
+    """
+    score = 0
+    has_keyword = False
+    if BOOKING_KEYWORDS.search(message):
+        score += 2
+        has_keyword = True
+    if WEAK_BOOKING_KEYWORDS.search(message):
+        score += 1
+        has_keyword = True
+    has_time = bool(TIME_EXPRESSIONS.search(message))
+    if has_time or (has_keyword and VAGUE_TIME_EXPRESSIONS.search(message)):
+        score += 1
+    if has_keyword or has_time:
+        for msg in (history or [])[-2:]:
+            if BOOKING_KEYWORDS.search(msg["message"]):
+                score += 1
+                break
+    return score
+
+
+def has_booking_intent(message: str, history: List[Dict[str, Any]] = None) -> bool:
+    """Check if a message (with its recent history) is about scheduling a call"""
+    return booking_intent_score(message, history) >= BOOKING_INTENT_THRESHOLD
+
+
+def format_slots_by_date(slots: List[Dict[str, Any]]) -> str:
+    """Format available slots as one line per date, e.g. '2025-10-10 (Friday): 09:00 [id 12], 10:00 [id 13]'"""
+    lines = []
+    current_date = None
+    for slot in slots:
+        if slot["date"] != current_date:
+            current_date = slot["date"]
+            lines.append(f"{current_date.isoformat()} ({current_date.strftime('%A')}):")
+            separator = " "
+        else:
+            separator = ", "
+        lines[-1] += f"{separator}{slot['display_time']} [id {slot['id']}]"
+    return "\n".join(lines)
+
+
+def mentions_slots(text: str, slots: List[Dict[str, Any]]) -> bool:
+    """Check if a reply offers any of the given slots by date (ISO or weekday) or time (e.g. '09:00', '9:00', '9am')"""
+    text = text.lower()
+    for slot in slots:
+        slot_date = slot["date"]
+        if slot_date.isoformat() in text or slot_date.strftime("%A").lower() in text:
+            return True
+        hour, minute = (int(part) for part in slot["display_time"].split(":"))
+        hour12 = hour % 12 or 12
+        suffix = "am" if hour < 12 else "pm"
+        if re.search(rf"\b0?{hour}:{minute:02d}\b|\b{hour12}(:{minute:02d})?\s?{suffix}\b", text):
+            return True
+    return False
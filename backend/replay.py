@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Conversation replay benchmark for Havana University Chat Bot
+Re-runs recorded student turns through Chatbot.generate_response and reports latency per phase,
+tokens per turn, tool calls and agreement with the original answers as JSON
+
+Usage:
+    python replay.py --chat-ids 12 15 [--mode replay|record|live] [--cassette replay_cassette.json]
+    python replay.py --recent 50 --mode record --cassette baseline.json
+    python replay.py --fixtures fixtures/*.json [--provider openai|gemini] [--history-window 10] [--output report.json]
+
+Modes:
+    replay  Offline, model responses are served from the cassette (default)
+    record  Calls the configured provider and stores its responses in the cassette
+    live    Calls the configured provider without a cassette
+
+A fixture file holds one transcript or a list of them:
+    {"chat_id": 1, "is_human_enabled": false, "slots": [...],
+     "messages": [{"role": "human", "message": "..."}, {"role": "ai", "message": "...", "escalated": false}]}
+
+Replay never writes to the database: booking tools run against a snapshot of the available slots
+(taken from the database or fixtures when recording and stored in the cassette).
+Exits with status 1 if a replay run hits responses missing from the cassette.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import serialization
+from chatbot import Chatbot
+from db.database import Database
+from dotenv import load_dotenv
+from langchain.schema import AIMessage
+
+DEFAULT_CASSETTE = "replay_cassette.json"
+CASSETTE_MISS = "Cassette miss"
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when the cassette has no response for the messages sent to the model"""
+
+
+class Cassette:
+    """
+    Recorded model responses keyed by a hash of the model name, bound tools and messages,
+    plus the booking slot snapshot the tools were run against.
+    """
+
+    def __init__(self, path: str, slots: List[Dict[str, Any]] = None, responses: Dict[str, Any] = None):
+        self.path = path
+        self.slots = slots or []
+        self.responses = responses or {}
+        self.replayed_latency_ms = 0  # Original latency of the responses served so far
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, "rb") as f:
+            data = serialization.loads(f.read())
+        slots = [_parse_slot(slot) for slot in data.get("slots", [])]
+        return cls(path, slots, data.get("responses", {}))
+
+    def save(self):
+        with open(self.path, "w") as f:
+            f.write(serialization.dumps({"version": 1, "slots": self.slots, "responses": self.responses}))
+
+
+def _parse_slot(slot: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore the date of a slot loaded from JSON"""
+    return {**slot, "date": date.fromisoformat(slot["date"]) if isinstance(slot["date"], str) else slot["date"]}
+
+
+def _message_key(message) -> Dict[str, Any]:
+    """The parts of a LangChain message that change the model response"""
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": [{"name": call["name"], "args": call["args"]} for call in getattr(message, "tool_calls", [])],
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+class CassetteModel:
+    """
+    Stand-in for a LangChain chat model with the bind_tools/invoke interface used by the Chatbot.
+    Serves responses from the cassette, and with a real model attached calls it on a miss
+    and records the response.
+    """
+
+    def __init__(self, cassette: Cassette, model_name: str, model=None, tools: List = None):
+        self.cassette = cassette
+        self.model_name = model_name
+        self.model = model
+        self.tools = tools or []
+
+    def bind_tools(self, tools: List, **kwargs) -> "CassetteModel":
+        model = self.model.bind_tools(tools, **kwargs) if self.model else None
+        return CassetteModel(self.cassette, self.model_name, model, tools)
+
+    def _key(self, messages: List) -> str:
+        payload = {
+            "model": self.model_name,
+            "tools": [{"name": tool.name, "description": tool.description} for tool in self.tools],
+            "messages": [_message_key(message) for message in messages],
+        }
+        return hashlib.sha256(serialization.dumps(payload).encode("utf-8")).hexdigest()
+
+    def invoke(self, messages: List) -> AIMessage:
+        key = self._key(messages)
+        entry = self.cassette.responses.get(key)
+
+        if entry is None:
+            if not self.model:
+                raise CassetteMiss(f"{CASSETTE_MISS}: no recorded response for {key[:12]}")
+            start = time.perf_counter()
+            response = self.model.invoke(messages)
+            entry = {
+                "content": response.content,
+                "tool_calls": response.tool_calls,
+                "usage_metadata": response.usage_metadata,
+                "latency_ms": int((time.perf_counter() - start) * 1000),
+            }
+            self.cassette.responses[key] = entry
+        else:
+            self.cassette.replayed_latency_ms += entry["latency_ms"]
+
+        return AIMessage(
+            content=entry["content"], tool_calls=entry["tool_calls"], usage_metadata=entry["usage_metadata"]
+        )
+
+
+class ReplayDatabase:
+    """Read-only database stand-in for the booking tools, serving a fixed slot snapshot"""
+
+    def __init__(self, slots: List[Dict[str, Any]]):
+        self.slots = slots
+
+    def get_available_bookings(self, use_primary: bool = False) -> List[Dict[str, Any]]:
+        return list(self.slots)
+
+    def book_slot(self, booking_id: int, chat_id: int) -> Optional[int]:
+        return booking_id if any(slot["id"] == booking_id for slot in self.slots) else None
+
+    def book_slot_at(self, slot_date: str, slot_time: str, chat_id: int) -> Optional[int]:
+        for slot in self.slots:
+            if slot["date"].isoformat() == slot_date and slot["time"] == slot_time:
+                return slot["id"]
+        return None
+
+
+def load_chat_transcripts(db, chat_ids: List[int]) -> List[Dict[str, Any]]:
+    """Load transcripts of the given chats from chat_history"""
+    transcripts = []
+    for chat_id in chat_ids:
+        chat = db.get_chat_by_id(chat_id)
+        if not chat:
+            print(f"Chat {chat_id} not found, skipping", file=sys.stderr)
+            continue
+        transcripts.append(
+            {
+                "chat_id": chat_id,
+                "is_human_enabled": bool(chat["is_human_enabled"]),
+                "messages": [{"role": row["role"], "message": row["message"]} for row in db.get_chat_history(chat_id)],
+            }
+        )
+    return transcripts
+
+
+def load_fixture_transcripts(paths: List[str]) -> List[Dict[str, Any]]:
+    """Load transcripts from fixture files, each holding one transcript or a list of them"""
+    transcripts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = serialization.loads(f.read())
+        transcripts.extend(data if isinstance(data, list) else [data])
+
+    for index, transcript in enumerate(transcripts, start=1):
+        transcript.setdefault("chat_id", index)
+    return transcripts
+
+
+def build_turns(transcript: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a transcript into the student turns the AI answered.
+    A turn is escalated if its fixture reply says so, or, for chats with human mode enabled,
+    if it is the last turn the AI answered (the AI stops replying once a chat is escalated).
+    """
+    messages = transcript["messages"]
+    turns = []
+    for index, msg in enumerate(messages):
+        if msg["role"] != "human":
+            continue
+        following = []
+        for later in messages[index + 1 :]:
+            if later["role"] == "human":
+                break
+            following.append(later)
+        replies = [later for later in following if later["role"] == "ai"]
+        if not replies:
+            continue
+        turns.append(
+            {
+                "chat_id": transcript["chat_id"],
+                "message_index": index,
+                "message": msg["message"],
+                "history": messages[: index + 1],
+                "original_response": replies[0]["message"],
+                "original_escalated": replies[0].get("escalated"),
+            }
+        )
+
+    for turn in turns:
+        if turn["original_escalated"] is None:
+            turn["original_escalated"] = bool(transcript.get("is_human_enabled")) and turn is turns[-1]
+    return turns
+
+
+def answer_similarity(first: str, second: str) -> float:
+    """Jaccard similarity of the lower-cased word sets of two answers"""
+    first_words = set(re.findall(r"\w+", first.lower()))
+    second_words = set(re.findall(r"\w+", second.lower()))
+    if not first_words and not second_words:
+        return 1.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def replay_turns(
+    chatbot: Chatbot, turns: List[Dict[str, Any]], agreement_threshold: float, cassette: Optional[Cassette]
+) -> List[Dict[str, Any]]:
+    """Run every turn through the chatbot and compare the result with the original answer"""
+    results = []
+    for turn in turns:
+        replayed_before = cassette.replayed_latency_ms if cassette else 0
+        result = chatbot.generate_response(turn["message"], turn["history"], chat_id=turn["chat_id"])
+        metrics = result.get("metrics", {})
+        error = result.get("error")
+        similarity = answer_similarity(result["response"], turn["original_response"])
+
+        results.append(
+            {
+                "chat_id": turn["chat_id"],
+                "message_index": turn["message_index"],
+                "error": error,
+                "cassette_miss": bool(error and error.startswith(CASSETTE_MISS)),
+                "model_calls": metrics.get("model_calls", 0),
+                "prompt_tokens": metrics.get("prompt_tokens", 0),
+                "completion_tokens": metrics.get("completion_tokens", 0),
+                "cached_tokens": metrics.get("cached_tokens", 0),
+                "cached_ratio": metrics.get("cached_ratio", 0.0),
+                "calls": metrics.get("calls", []),
+                "tool_calls": metrics.get("tool_calls", []),
+                "phases_ms": metrics.get("phases_ms", {}),
+                "recorded_model_ms": (cassette.replayed_latency_ms - replayed_before) if cassette else None,
+                "answer_similarity": round(similarity, 4),
+                "answer_agrees": similarity >= agreement_threshold,
+                "original_escalated": turn["original_escalated"],
+                "escalated": result.get("needs_escalation", False),
+                "escalation_agrees": result.get("needs_escalation", False) == turn["original_escalated"],
+            }
+        )
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate per-turn results into the benchmark summary"""
+    completed = [result for result in results if not result["error"]]
+    count = len(completed) or 1
+
+    tool_calls: Dict[str, int] = {}
+    for result in completed:
+        for name in result["tool_calls"]:
+            tool_calls[name] = tool_calls.get(name, 0) + 1
+
+    phases = {}
+    for phase in ["prepare", "prefetch", "model", "tools", "total"]:
+        values = [result["phases_ms"].get(phase, 0) for result in completed]
+        phases[phase] = {
+            "mean": round(sum(values) / count, 1),
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+        }
+
+    # Model latency of the original calls for turns served from the cassette
+    recorded = [result["recorded_model_ms"] for result in completed if result["recorded_model_ms"]]
+    recorded_model_ms = None
+    if recorded:
+        recorded_model_ms = {"mean": round(sum(recorded) / len(recorded), 1), "p95": _percentile(recorded, 0.95)}
+    prompt_tokens = sum(result["prompt_tokens"] for result in completed)
+    completion_tokens = sum(result["completion_tokens"] for result in completed)
+    cached_tokens = sum(result["cached_tokens"] for result in completed)
+
+    return {
+        "turns": len(results),
+        "completed_turns": len(completed),
+        "errors": len(results) - len(completed),
+        "cassette_misses": sum(1 for result in results if result["cassette_miss"]),
+        "model_calls": sum(result["model_calls"] for result in completed),
+        "tokens": {
+            "prompt": prompt_tokens,
+            "completion": completion_tokens,
+            "cached": cached_tokens,
+            "cached_ratio": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "per_turn": round((prompt_tokens + completion_tokens) / count, 1),
+        },
+        "tool_calls": {
+            "total": sum(tool_calls.values()),
+            "per_turn": round(sum(tool_calls.values()) / count, 3),
+            "by_tool": tool_calls,
+        },
+        "latency_ms": phases,
+        "recorded_model_ms": recorded_model_ms,
+        "answer_agreement": round(sum(1 for result in completed if result["answer_agrees"]) / count, 4),
+        "mean_answer_similarity": round(sum(result["answer_similarity"] for result in completed) / count, 4),
+        "escalation_agreement": round(sum(1 for result in completed if result["escalation_agrees"]) / count, 4),
+        "escalations": {
+            "original": sum(1 for result in completed if result["original_escalated"]),
+            "replay": sum(1 for result in completed if result["escalated"]),
+        },
+    }
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Replay recorded conversations through the chatbot")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--chat-ids", type=int, nargs="+", help="Replay these chats from chat_history")
+    source.add_argument("--recent", type=int, help="Replay the most recent N chats from chat_history")
+    source.add_argument("--fixtures", nargs="+", help="Replay transcripts from fixture JSON files")
+    parser.add_argument("--mode", choices=["replay", "record", "live"], default="replay", help="Model response source")
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE, help="Cassette file for replay and record modes")
+    parser.add_argument("--provider", choices=["openai", "gemini"], default="openai", help="Model provider")
+    parser.add_argument("--history-window", type=int, help="History messages sent to the model")
+    parser.add_argument(
+        "--agreement-threshold", type=float, default=0.5, help="Answer similarity that counts as agreement"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Keep stdout for the JSON report, Database and Chatbot print their status messages
+    with redirect_stdout(sys.stderr):
+        db = None
+        if not args.fixtures:
+            db = Database()
+            if not db.connect():
+                raise SystemExit(1)
+            chat_ids = args.chat_ids or [chat["id"] for chat in db.get_all_chats()[: args.recent]]
+            transcripts = load_chat_transcripts(db, chat_ids)
+        else:
+            transcripts = load_fixture_transcripts(args.fixtures)
+
+        if args.mode == "replay":
+            cassette = Cassette.load(args.cassette)
+        else:
+            fixture_slots = [_parse_slot(slot) for transcript in transcripts for slot in transcript.get("slots", [])]
+            slots = db.get_available_bookings(use_primary=True) if db else fixture_slots
+            cassette = Cassette(args.cassette, slots)
+
+        chatbot = Chatbot(db=ReplayDatabase(cassette.slots))
+        chatbot.set_model(args.provider)
+        if args.history_window is not None:
+            chatbot.history_window = args.history_window
+
+        if args.mode == "live":
+            cassette = None
+        else:
+            provider_model = chatbot.openai_model if args.provider == "openai" else chatbot.gemini_model
+            if args.mode == "record" and not provider_model:
+                print(f"The {args.provider} model is not configured, check your API key")
+                raise SystemExit(1)
+            model = CassetteModel(cassette, chatbot.model_names[args.provider], provider_model)
+            if args.provider == "openai":
+                chatbot.openai_model = model
+            else:
+                chatbot.gemini_model = model
+
+        turns = [turn for transcript in transcripts for turn in build_turns(transcript)]
+        results = replay_turns(chatbot, turns, args.agreement_threshold, cassette)
+
+        if args.mode == "record":
+            cassette.save()
+
+    report = {
+        "config": {
+            "mode": args.mode,
+            "provider": args.provider,
+            "model": chatbot.model_names[args.provider],
+            "history_window": chatbot.history_window,
+            "agreement_threshold": args.agreement_threshold,
+            "chats": len(transcripts),
+        },
+        "summary": summarize(results),
+        "turns": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.mode == "replay" and report["summary"]["cassette_misses"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Chat retention for Havana University Chat Bot
+Moves old and soft-deleted chats out of the hot tables into compressed archive files
+and removes chats that never received a message
+
+Usage:
+    python retention.py archive [--max-batches N]
+    python retention.py restore CHAT_ID
+    python retention.py purge --keep-months N
+    python retention.py remove-empty [--older-than-hours N]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import zstandard
+from db.database import Database
+from dotenv import load_dotenv
+
+
+class ChatArchiver:
+    """
+    Archives chats into month-bucketed zstd-compressed NDJSON files.
+
+    Each archived chat is written as one line ({"chat", "history", "bookings"}) to
+    `<archive_dir>/<YYYY-MM>/chats-<first_id>-<last_id>-<run_id>.ndjson.zst`, where the month is
+    the month the chat was created and the run ID makes every file unique to the run that wrote it.
+    The chat_archive table records which file holds each chat, so a single chat can be restored
+    and a whole month can be purged by dropping its directory.
+    """
+
+    def __init__(
+        self,
+        db,
+        archive_dir: str = None,
+        retention_days: int = None,
+        batch_size: int = None,
+        empty_chat_hours: int = None,
+    ):
+        self.db = db
+        self.archive_dir = archive_dir or os.getenv("ARCHIVE_DIR", "archive")
+        self.retention_days = retention_days if retention_days is not None else int(os.getenv("RETENTION_DAYS", "0"))
+        self.batch_size = batch_size or int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+        self.empty_chat_hours = empty_chat_hours or int(os.getenv("EMPTY_CHAT_MAX_AGE_HOURS", "24"))
+
+    def archive_batch(self) -> int:
+        """Archive one bounded batch of chats, returns the number of chats archived"""
+        if self.retention_days <= 0:
+            return 0
+
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        chat_ids = self.db.get_archivable_chat_ids(cutoff, self.batch_size)
+        if not chat_ids:
+            return 0
+
+        chats = self.db.get_chats_for_archive(chat_ids)
+        history_by_chat = self._group_by_chat(self.db.get_history_for_archive(chat_ids))
+        bookings_by_chat = self._group_by_chat(self.db.get_bookings_for_archive(chat_ids))
+
+        # Group chats by creation month so each month can later be purged as a unit
+        chats_by_month: Dict[str, List[Dict[str, Any]]] = {}
+        for chat in chats:
+            month = chat["created_at"].strftime("%Y-%m") if chat["created_at"] else "unknown"
+            chats_by_month.setdefault(month, []).append(chat)
+
+        archived = 0
+        run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        for month, month_chats in chats_by_month.items():
+            archive_path = os.path.join(
+                self.archive_dir, month, f"chats-{month_chats[0]['id']}-{month_chats[-1]['id']}-{run_id}.ndjson.zst"
+            )
+            records = [
+                {
+                    "chat": chat,
+                    "history": history_by_chat.get(chat["id"], []),
+                    "bookings": bookings_by_chat.get(chat["id"], []),
+                }
+                for chat in month_chats
+            ]
+            self._write_archive(archive_path, records)
+
+            archive_entries = [
+                {
+                    "chat_id": record["chat"]["id"],
+                    "archive_month": month,
+                    "archive_path": archive_path,
+                    "message_count": len(record["history"]),
+                    "last_message_id": max((message["id"] for message in record["history"]), default=0),
+                    "chat_created_at": record["chat"]["created_at"],
+                }
+                for record in records
+            ]
+            removed = self.db.remove_archived_chats(archive_entries)
+            if removed:
+                # Chats skipped because they changed stay in the hot tables, the manifest never points at their copy
+                archived += len(removed)
+            else:
+                # The chats are still in the hot tables, drop the orphaned file (only this run wrote it)
+                os.remove(archive_path)
+
+        print(f"Archived {archived} chats")
+        return archived
+
+    def archive(self, max_batches: int = 10) -> int:
+        """
+        Archive up to `max_batches` batches, stopping early once nothing is left.
+        Runs are serialized with a database lock, a run that finds another one in progress does nothing.
+        """
+        total = 0
+        with self.db.named_lock("chat_archive") as acquired:
+            if not acquired:
+                print("Another archive run is in progress, skipping")
+                return 0
+            for _ in range(max_batches):
+                archived = self.archive_batch()
+                if not archived:
+                    break
+                total += archived
+        return total
+
+    def restore_chat(self, chat_id: int) -> bool:
+        """Move a single archived chat back into the hot tables"""
+        entry = self.db.get_chat_archive_entry(chat_id)
+        if not entry:
+            print(f"Chat {chat_id} is not archived")
+            return False
+
+        record = self._find_in_archive(entry["archive_path"], chat_id)
+        if not record:
+            print(f"Chat {chat_id} not found in {entry['archive_path']}")
+            return False
+
+        if not self.db.restore_archived_chat(record["chat"], record["history"], record["bookings"]):
+            return False
+
+        print(f"Restored chat {chat_id} with {len(record['history'])} messages")
+        return True
+
+    def purge_before(self, archive_month: str, batch_size: int = 1000) -> int:
+        """
+        Permanently delete all archives for months before `archive_month` ('YYYY-MM').
+        Whole month directories are dropped, then manifest rows are deleted in batches.
+        Returns the number of month directories removed.
+        """
+        removed = 0
+        if os.path.isdir(self.archive_dir):
+            for month in sorted(os.listdir(self.archive_dir)):
+                month_dir = os.path.join(self.archive_dir, month)
+                if month < archive_month and os.path.isdir(month_dir):
+                    shutil.rmtree(month_dir)
+                    removed += 1
+
+        while True:
+            deleted = self.db.delete_archive_entries_before(archive_month, batch_size)
+            if deleted < batch_size:
+                break
+
+        print(f"Purged {removed} archive months before {archive_month}")
+        return removed
+
+    def remove_empty_chats(self, batch_size: int = 1000) -> int:
+        """
+        Delete chats older than `empty_chat_hours` that never received a message, in batches.
+        Chats are only created on the first student message now, these are left over from
+        clients that still create a chat when they connect. Returns the number of chats deleted.
+        """
+        cutoff = datetime.now() - timedelta(hours=self.empty_chat_hours)
+        total = 0
+        while True:
+            deleted = self.db.delete_empty_chats(cutoff, batch_size)
+            if deleted <= 0:
+                break
+            total += deleted
+            if deleted < batch_size:
+                break
+
+        print(f"Removed {total} empty chats")
+        return total
+
+    @staticmethod
+    def _group_by_chat(rows: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        """Group rows by their chat_id"""
+        grouped: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            grouped.setdefault(row["chat_id"], []).append(row)
+        return grouped
+
+    @staticmethod
+    def _write_archive(archive_path: str, records: List[Dict[str, Any]]):
+        """Write records as zstd-compressed NDJSON, atomically replacing any partial file"""
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        tmp_path = f"{archive_path}.tmp"
+        compressor = zstandard.ZstdCompressor(level=10)
+        with open(tmp_path, "wb") as file:
+            with compressor.stream_writer(file, closefd=False) as writer:
+                for record in records:
+                    writer.write((json.dumps(record, default=str) + "\n").encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, archive_path)
+
+    @staticmethod
+    def _find_in_archive(archive_path: str, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Stream an archive file and return the record for a chat"""
+        decompressor = zstandard.ZstdDecompressor()
+        with open(archive_path, "rb") as file:
+            with decompressor.stream_reader(file) as reader:
+                for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                    record = json.loads(line)
+                    if record["chat"]["id"] == chat_id:
+                        return record
+        return None
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Archive, restore and purge chats")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="Archive old and soft-deleted chats")
+    archive_parser.add_argument("--max-batches", type=int, default=100)
+
+    restore_parser = subparsers.add_parser("restore", help="Restore a single archived chat")
+    restore_parser.add_argument("chat_id", type=int)
+
+    purge_parser = subparsers.add_parser("purge", help="Permanently delete old archive months")
+    purge_parser.add_argument("--keep-months", type=int, required=True)
+
+    remove_empty_parser = subparsers.add_parser("remove-empty", help="Delete chats that never received a message")
+    remove_empty_parser.add_argument("--older-than-hours", type=int, help="Minimum chat age (EMPTY_CHAT_MAX_AGE_HOURS)")
+
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.connect():
+        raise SystemExit(1)
+
+    archiver = ChatArchiver(db, empty_chat_hours=getattr(args, "older_than_hours", None))
+    if args.command == "archive":
+        archiver.archive(max_batches=args.max_batches)
+    elif args.command == "restore":
+        if not archiver.restore_chat(args.chat_id):
+            raise SystemExit(1)
+    elif args.command == "purge":
+        today = datetime.now()
+        month_index = today.year * 12 + today.month - 1 - args.keep_months
+        archiver.purge_before(f"{month_index // 12:04d}-{month_index % 12 + 1:02d}")
+    elif args.command == "remove-empty":
+        archiver.remove_empty_chats()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Database migration script for Havana University Chat Bot
-Run this script to create tables and seed initial data
+Run this script to create and update tables (booking slots are generated by slots.py)
 """
 
 import os
@@ -13,9 +13,54 @@ from mysql.connector import Error
 # Load environment variables
 load_dotenv()
 
+# List of migration files in order
+MIGRATION_FILES = [
+    "db/migrations/001_create_chats_table.sql",
+    "db/migrations/002_create_chat_history_table.sql",
+    "db/migrations/003_create_bookings_table.sql",
+    "db/migrations/005_create_chat_usage_table.sql",
+    "db/migrations/006_create_chat_archive_table.sql",
+    "db/migrations/007_add_chat_history_fulltext_index.sql",
+    "db/migrations/008_add_booking_advisors.sql",
+]
+
+# Migrations that were applied before schema_migrations existed
+# (004 seeded static booking slots and has been replaced by slots.py)
+LEGACY_MIGRATION_FILES = [
+    "db/migrations/001_create_chats_table.sql",
+    "db/migrations/002_create_chat_history_table.sql",
+    "db/migrations/003_create_bookings_table.sql",
+    "db/migrations/004_seed_booking_slots.sql",
+]
+
+
+def get_applied_migrations(cursor) -> set:
+    """Create the schema_migrations table if needed and return the applied migration files"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("SELECT filename FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    # Databases created before migrations were tracked already ran the legacy files,
+    # re-running the seed migration would duplicate booking slots
+    if not applied:
+        cursor.execute("SHOW TABLES LIKE 'bookings'")
+        if cursor.fetchone():
+            for migration_file in LEGACY_MIGRATION_FILES:
+                cursor.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (migration_file,))
+            applied = set(LEGACY_MIGRATION_FILES)
+
+    return applied
+
 
 def run_migrations():
-    """Execute all SQL migration files in order"""
+    """Execute all pending SQL migration files in order"""
 
     # Database connection parameters
     host = os.getenv("DB_HOST", "localhost")
@@ -34,16 +79,15 @@ def run_migrations():
             print("Successfully connected to MySQL database")
             cursor = connection.cursor()
 
-            # List of migration files in order
-            migration_files = [
-                "db/migrations/001_create_chats_table.sql",
-                "db/migrations/002_create_chat_history_table.sql",
-                "db/migrations/003_create_bookings_table.sql",
-                "db/migrations/004_seed_booking_slots.sql",
-            ]
+            applied_migrations = get_applied_migrations(cursor)
+            connection.commit()
+
+            # Execute each pending migration file
+            for migration_file in MIGRATION_FILES:
+                if migration_file in applied_migrations:
+                    print(f"\nSkipping already applied migration: {migration_file}")
+                    continue
 
-            # Execute each migration file
-            for migration_file in migration_files:
                 print(f"\nExecuting migration: {migration_file}")
 
                 try:
@@ -57,6 +101,9 @@ def run_migrations():
                             cursor.execute(statement)
                             connection.commit()
 
+                        cursor.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (migration_file,))
+                        connection.commit()
+
                         print(f"✓ Successfully executed {migration_file}")
 
                 except FileNotFoundError:
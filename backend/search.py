@@ -0,0 +1,86 @@
+import html
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+SNIPPET_LENGTH = 160
+
+
+def make_snippet(message: str, terms: List[str], length: int = SNIPPET_LENGTH) -> str:
+    """
+    Build an HTML-escaped snippet of the message around the first matching term,
+    with every matching term wrapped in <mark> tags.
+    """
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE) if terms else None
+
+    # Center the snippet on the first match
+    match = pattern.search(message) if pattern else None
+    start = max(0, match.start() - length // 3) if match else 0
+    end = min(len(message), start + length)
+    excerpt = message[start:end]
+
+    parts = []
+    last = 0
+    for term_match in pattern.finditer(excerpt) if pattern else []:
+        parts.append(html.escape(excerpt[last : term_match.start()]))
+        parts.append(f"<mark>{html.escape(term_match.group())}</mark>")
+        last = term_match.end()
+    parts.append(html.escape(excerpt[last:]))
+
+    snippet = "".join(parts)
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(message):
+        snippet = snippet + "…"
+    return snippet
+
+
+def encode_cursor(score: float, message_id: int) -> str:
+    """Encode the keyset position of a search result"""
+    return f"{score!r}:{message_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_cursor, raises ValueError if it is malformed"""
+    score, message_id = cursor.split(":")
+    return float(score), int(message_id)
+
+
+def search_messages(
+    db,
+    search_query: str,
+    role: str = None,
+    start=None,
+    end=None,
+    is_human_enabled: bool = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """Run a ranked full-text search and return one page of results with highlighted snippets"""
+    after_score, after_id = decode_cursor(cursor) if cursor else (None, None)
+    rows = db.search_messages(
+        search_query,
+        role=role,
+        start=start,
+        end=end,
+        is_human_enabled=is_human_enabled,
+        after_score=after_score,
+        after_id=after_id,
+        limit=limit,
+    )
+
+    terms = [term for term in re.findall(r"\w+", search_query) if len(term) > 1]
+    results = [
+        {
+            "id": row["id"],
+            "chat_id": row["chat_id"],
+            "role": row["role"],
+            "created_at": row["created_at"],
+            "is_human_enabled": bool(row["is_human_enabled"]),
+            "score": row["score"],
+            "snippet": make_snippet(row["message"], terms),
+        }
+        for row in rows
+    ]
+
+    next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["id"]) if len(rows) == limit else None
+    return {"results": results, "next_cursor": next_cursor}
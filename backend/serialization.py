@@ -0,0 +1,44 @@
+"""
+JSON serialization shared by the REST API (Flask), Socket.IO and tool outputs.
+Backed by orjson, which encodes datetime and date values natively as ISO 8601 strings,
+so database rows can be serialized as-is without per-row conversion loops.
+"""
+
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from flask.json.provider import JSONProvider
+
+
+def _default(obj: Any) -> Any:
+    """Encode types orjson does not support natively"""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, **kwargs) -> str:
+    """
+    Serialize an object to a JSON string.
+    Keyword arguments (e.g. `separators` passed by python-socketio) are accepted for json.dumps
+    compatibility and ignored, the output is always compact.
+    """
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+def loads(s, **kwargs) -> Any:
+    """Deserialize a JSON string or bytes"""
+    return orjson.loads(s)
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider used by jsonify and request.get_json"""
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        return dumps(obj)
+
+    def loads(self, s, **kwargs) -> Any:
+        return loads(s)
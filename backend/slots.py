@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Booking slot generation for Havana University Chat Bot
+Keeps a rolling window of bookable slots and prunes unbooked slots in the past
+
+Usage:
+    python slots.py [--prune-only]
+"""
+
+import argparse
+import os
+from datetime import date, timedelta
+from typing import List, Tuple
+
+from db.database import Database
+from dotenv import load_dotenv
+
+
+def _parse_list(value: str) -> List[str]:
+    """Split a comma-separated setting into its non-empty values"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class SlotGenerator:
+    """
+    Generates advisor call slots for the next `horizon_days` days.
+
+    Slots are created for every configured advisor, weekday (0 = Monday) and hour (HHMM).
+    Generation is idempotent: missing slots are inserted in a single statement and existing
+    ones are skipped by the unique_booking_slot key, so it can run as often as needed.
+    """
+
+    def __init__(
+        self,
+        db,
+        advisors: List[str] = None,
+        weekdays: List[int] = None,
+        hours: List[str] = None,
+        horizon_days: int = None,
+        prune_batch_size: int = None,
+    ):
+        self.db = db
+        self.advisors = advisors or _parse_list(os.getenv("SLOT_ADVISORS", "admissions"))
+        self.weekdays = weekdays or [int(day) for day in _parse_list(os.getenv("SLOT_WEEKDAYS", "0,1,2,3,4,5,6"))]
+        self.hours = hours or _parse_list(os.getenv("SLOT_HOURS", "0900,1000,1100,1400,1500,1600"))
+        self.horizon_days = horizon_days or int(os.getenv("SLOT_HORIZON_DAYS", "7"))
+        self.prune_batch_size = prune_batch_size or int(os.getenv("SLOT_PRUNE_BATCH_SIZE", "500"))
+
+    def build_slots(self, today: date = None) -> List[Tuple[date, str, str]]:
+        """Build the (date, time, advisor) slots for the rolling window starting tomorrow"""
+        today = today or date.today()
+        slots = []
+        for offset in range(1, self.horizon_days + 1):
+            day = today + timedelta(days=offset)
+            if day.weekday() not in self.weekdays:
+                continue
+            for hour in self.hours:
+                for advisor in self.advisors:
+                    slots.append((day, hour, advisor))
+        return slots
+
+    def generate(self) -> int:
+        """Insert any missing slots in the rolling window, returns the number of slots in the window"""
+        slots = self.build_slots()
+        if not self.db.add_booking_slots(slots):
+            return 0
+        return len(slots)
+
+    def prune(self) -> int:
+        """Delete unbooked slots in the past in batches, returns the number of slots deleted"""
+        total = 0
+        while True:
+            deleted = self.db.delete_past_unbooked_slots(self.prune_batch_size)
+            if deleted <= 0:
+                break
+            total += deleted
+            if deleted < self.prune_batch_size:
+                break
+        return total
+
+    def run(self):
+        """Prune past slots and fill the rolling window"""
+        pruned = self.prune()
+        generated = self.generate()
+        print(f"Booking slots: {generated} in the next {self.horizon_days} days, pruned {pruned} past slots")
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Generate booking slots and prune past ones")
+    parser.add_argument("--prune-only", action="store_true", help="Only delete unbooked slots in the past")
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.connect():
+        raise SystemExit(1)
+
+    generator = SlotGenerator(db)
+    if args.prune_only:
+        print(f"Pruned {generator.prune()} past slots")
+    else:
+        generator.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class UsageLedger:
+    """
+    Collects token usage for every model call and writes it to the chat_usage table in batches.
+
+    Records are buffered in memory and flushed either when the buffer reaches `batch_size`
+    or when `flush()` is called by the periodic background task in app.py. Running totals
+    are kept in memory so token budgets can be checked without a database round trip.
+    """
+
+    def __init__(self, db=None, batch_size: int = 50, max_tracked_chats: int = 10000):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_tracked_chats = max_tracked_chats
+
+        # Token budgets (0 disables the budget)
+        self.chat_token_budget = int(os.getenv("CHAT_TOKEN_BUDGET", "0"))
+        self.daily_token_budget = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._chat_totals: "OrderedDict[int, int]" = OrderedDict()  # {chat_id: total_tokens}
+        self._daily_total = None
+        self._daily_date = None
+
+    @staticmethod
+    def extract_usage(response) -> Dict[str, int]:
+        """Read prompt, completion and cached token counts from a LangChain AIMessage"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_details = usage.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0) or 0,
+            "completion_tokens": usage.get("output_tokens", 0) or 0,
+            "cached_tokens": input_details.get("cache_read", 0) or 0,
+        }
+
+    def record(
+        self, chat_id: Optional[int], provider: str, model: str, usage: Dict[str, int], latency_ms: int
+    ) -> Dict[str, Any]:
+        """Buffer a usage record for a single model call and update the running totals"""
+        record = {
+            "chat_id": chat_id,
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "latency_ms": latency_ms,
+        }
+        total_tokens = record["prompt_tokens"] + record["completion_tokens"]
+
+        # Load totals before buffering so the new record is not counted twice
+        if chat_id:
+            self.get_chat_tokens(chat_id)
+        self.get_daily_tokens()
+
+        with self._lock:
+            self._pending.append(record)
+            if chat_id:
+                self._chat_totals[chat_id] = self._chat_totals.get(chat_id, 0) + total_tokens
+            self._daily_total += total_tokens
+            should_flush = len(self._pending) >= self.batch_size
+
+        if should_flush:
+            self.flush()
+
+        return record
+
+    def flush(self) -> int:
+        """Write all buffered records to the database, returns the number of records written"""
+        with self._lock:
+            records = self._pending
+            self._pending = []
+
+        if not records:
+            return 0
+
+        if not self.db or not self.db.add_usage_records(records):
+            # Keep the records for the next flush rather than losing them, up to a bounded backlog
+            with self._lock:
+                self._pending = (records + self._pending)[-self.batch_size * 20 :]
+            return 0
+
+        return len(records)
+
+    def get_chat_tokens(self, chat_id: int) -> int:
+        """Get the total number of tokens used by a chat"""
+        with self._lock:
+            if chat_id in self._chat_totals:
+                self._chat_totals.move_to_end(chat_id)
+                return self._chat_totals[chat_id]
+
+        usage = self.db.get_chat_usage(chat_id) if self.db else None
+        total = (usage["prompt_tokens"] + usage["completion_tokens"]) if usage else 0
+
+        with self._lock:
+            total = self._chat_totals.setdefault(chat_id, total)
+            self._chat_totals.move_to_end(chat_id)
+            while len(self._chat_totals) > self.max_tracked_chats:
+                self._chat_totals.popitem(last=False)
+        return total
+
+    def get_daily_tokens(self) -> int:
+        """Get the total number of tokens used today across all chats"""
+        today = datetime.now().date()
+        with self._lock:
+            if self._daily_date == today and self._daily_total is not None:
+                return self._daily_total
+
+        start_of_day = datetime.combine(today, datetime.min.time())
+        total = self.db.get_total_tokens_since(start_of_day) if self.db else 0
+        with self._lock:
+            pending_today = sum(r["prompt_tokens"] + r["completion_tokens"] for r in self._pending)
+            self._daily_date = today
+            self._daily_total = total + pending_today
+            return self._daily_total
+
+    def is_chat_over_budget(self, chat_id: Optional[int]) -> bool:
+        """Check if a chat has used up its token budget"""
+        if not chat_id or not self.chat_token_budget:
+            return False
+        return self.get_chat_tokens(chat_id) >= self.chat_token_budget
+
+    def is_daily_over_budget(self) -> bool:
+        """Check if the global daily token budget has been used up"""
+        if not self.daily_token_budget:
+            return False
+        return self.get_daily_tokens() >= self.daily_token_budget
+
+    def get_budget_status(self) -> Dict[str, Any]:
+        """Get the configured budgets and today's usage"""
+        return {
+            "chat_token_budget": self.chat_token_budget,
+            "daily_token_budget": self.daily_token_budget,
+            "daily_tokens": self.get_daily_tokens(),
+            "daily_over_budget": self.is_daily_over_budget(),
+            "pending_records": len(self._pending),
+        }
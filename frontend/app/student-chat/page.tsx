@@ -7,17 +7,22 @@ import { Textarea } from "@/components/ui/textarea";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { getSocket } from "@/lib/socket";
 import { api } from "@/lib/api";
-import { Chat, Message } from "@/lib/types";
+import { createSessionId } from "@/lib/utils";
+import { Chat, Message, StudentConnectedEvent } from "@/lib/types";
 import { Plus, Send } from "lucide-react";
 
 export default function StudentChatPage() {
   const [chats, setChats] = useState<Chat[]>([]);
   const [currentChatId, setCurrentChatId] = useState<number | null>(null);
+  // Provisional session for a new conversation, the chat is only created with its first message
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [messages, setMessages] = useState<Message[]>([]);
   const [inputMessage, setInputMessage] = useState("");
   const [isAdminConnected, setIsAdminConnected] = useState(false);
   const [isHumanEnabled, setIsHumanEnabled] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Updated as soon as chat_created arrives, so the first message's broadcast is not dropped
+  const currentChatIdRef = useRef<number | null>(null);
 
   useEffect(() => {
     const socket = getSocket();
@@ -27,21 +32,21 @@ export default function StudentChatPage() {
     loadChats();
 
     // Socket event listeners
-    socket.on("chat_created", (data: { chat_id: number }) => {
+    socket.on("chat_created", (data: { chat_id: number; session_id?: string }) => {
+      currentChatIdRef.current = data.chat_id;
       setCurrentChatId(data.chat_id);
+      setSessionId(null);
       loadChats();
     });
 
-    socket.on("student_connected", (data: { chat_id: number; chat: Chat; history: Message[]; is_admin_connected: boolean }) => {
+    socket.on("student_connected", (data: StudentConnectedEvent) => {
       setMessages(data.history || []);
       setIsAdminConnected(data.is_admin_connected);
-      if (data.chat) {
-        setIsHumanEnabled(data.chat.is_human_enabled);
-      }
+      setIsHumanEnabled(data.chat ? data.chat.is_human_enabled : false);
     });
 
     socket.on("new_message", (data: Message) => {
-      if (data.chat_id === currentChatId) {
+      if (data.chat_id === currentChatIdRef.current) {
         setMessages((prev) => [...prev, data]);
       }
     });
@@ -74,6 +79,10 @@ export default function StudentChatPage() {
     };
   }, [currentChatId]);
 
+  useEffect(() => {
+    currentChatIdRef.current = currentChatId;
+  }, [currentChatId]);
+
   // Auto-scroll to bottom when messages change
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -87,22 +96,26 @@ export default function StudentChatPage() {
   };
 
   const handleNewChat = () => {
+    const newSessionId = createSessionId();
+    setCurrentChatId(null);
+    setSessionId(newSessionId);
     const socket = getSocket();
-    socket.emit("student_connect", {});
+    socket.emit("student_connect", { session_id: newSessionId });
   };
 
   const handleSelectChat = (chatId: number) => {
+    setSessionId(null);
     setCurrentChatId(chatId);
     const socket = getSocket();
     socket.emit("student_connect", { chat_id: chatId });
   };
 
   const handleSendMessage = () => {
-    if (!inputMessage.trim() || !currentChatId) return;
+    if (!inputMessage.trim() || (!currentChatId && !sessionId)) return;
 
     const socket = getSocket();
     socket.emit("student_message", {
-      chat_id: currentChatId,
+      ...(currentChatId ? { chat_id: currentChatId } : { session_id: sessionId }),
       message: inputMessage,
     });
 
@@ -134,7 +147,7 @@ export default function StudentChatPage() {
           </p>
         </div>
 
-        {currentChatId ? (
+        {currentChatId || sessionId ? (
           <>
             {/* Status Bar */}
             {isHumanEnabled && (
@@ -12,6 +12,14 @@ export interface Message {
   created_at?: string;
 }
 
+export interface StudentConnectedEvent {
+  chat_id: number | null;
+  session_id?: string;
+  chat: Chat | null;
+  history: Message[];
+  is_admin_connected: boolean;
+}
+
 export interface BookingSlot {
   id: number;
   date: string;